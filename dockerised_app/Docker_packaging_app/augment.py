@@ -0,0 +1,71 @@
+import time
+
+import numpy as np
+from tensorflow import keras
+
+
+def augment_batch(x, y, rng, min_crop=0.8, brightness=0.2):
+    """
+    fonction qui augmente un batch entier (B, H, W, C) en une seule fois:
+    - crop aléatoire (redimensionné à la taille d'origine, plus proche voisin)
+    - flip horizontal aléatoire
+    les mêmes transformations sont appliquées aux images et aux masques
+    - variation de luminosité (images seulement)
+    """
+    b, h, w = x.shape[:3]
+
+    # taille et position du crop pour chaque image du batch
+    scale = rng.uniform(min_crop, 1.0, b)
+    crop_h = (scale * h).astype(int)
+    crop_w = (scale * w).astype(int)
+    top = (rng.uniform(0, 1, b) * (h - crop_h + 1)).astype(int)
+    left = (rng.uniform(0, 1, b) * (w - crop_w + 1)).astype(int)
+
+    # lignes / colonnes sources de chaque pixel de sortie: (B, H) et (B, W)
+    rows = top[:, None] + (np.arange(h)[None, :] * crop_h[:, None]) // h
+    cols = left[:, None] + (np.arange(w)[None, :] * crop_w[:, None]) // w
+    # le flip revient à lire les colonnes à l'envers
+    flip = rng.uniform(0, 1, b) < 0.5
+    cols = np.where(flip[:, None], cols[:, ::-1], cols)
+
+    batch = np.arange(b)[:, None, None]
+    x = x[batch, rows[:, :, None], cols[:, None, :]]
+    y = y[batch, rows[:, :, None], cols[:, None, :]]
+
+    factor = rng.uniform(1 - brightness, 1 + brightness, b).astype("float32")
+    x = np.clip(x * factor[:, None, None, None], 0, 255).astype(x.dtype)
+    return x, y
+
+
+class AugmentedSequence(keras.utils.Sequence):
+    """Wraps a batch Sequence and applies augment_batch to every batch."""
+
+    def __init__(self, sequence, seed=None, **augment_args):
+        self.sequence = sequence
+        self.augment_args = augment_args
+        self.rng = np.random.RandomState(seed)
+        # temps passé à augmenter les batches
+        self.augment_time = 0.0
+        self.batch_count = 0
+
+    def __len__(self):
+        return len(self.sequence)
+
+    def __getitem__(self, idx):
+        x, y = self.sequence[idx]
+        start = time.perf_counter()
+        x, y = augment_batch(x, y, self.rng, **self.augment_args)
+        self.augment_time += time.perf_counter() - start
+        self.batch_count += 1
+        return x, y
+
+    def on_epoch_end(self):
+        if self.batch_count:
+            print(
+                f"\naugmentation: {1000 * self.augment_time / self.batch_count:.1f} ms/batch "
+                f"({self.augment_time:.2f}s sur {self.batch_count} batches)"
+            )
+        self.augment_time = 0.0
+        self.batch_count = 0
+        if hasattr(self.sequence, "on_epoch_end"):
+            self.sequence.on_epoch_end()
@@ -0,0 +1,75 @@
+import argparse
+import itertools
+import json
+import subprocess
+import sys
+
+from config import img_size, num_classes
+
+
+def measure(width, depth, block, batch_sizes, repeats=10):
+    """
+    paramètres, GFLOPs par image, latence CPU (ms par batch) pour chaque
+    taille de batch et pic mémoire (Mo) d'une variante du U-Net
+    """
+    # imports ici: TensorFlow n'est chargé que dans les sous-processus
+    from callbacks import peak_rss_mb
+    from model_stats import count_flops, measure_latency
+    from seg_model import get_model
+
+    model = get_model(img_size, num_classes, width=width, depth=depth, block=block)
+    return {
+        "params": model.count_params(),
+        "gflops": count_flops(model) / 1e9,
+        "latency_ms": {bs: 1000 * measure_latency(model, bs, repeats) for bs in batch_sizes},
+        "peak_mb": peak_rss_mb(),
+    }
+
+
+def _parse_list(cast):
+    return lambda value: [cast(v) for v in value.split(",")]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="compare taille, coût et latence CPU de plusieurs variantes du U-Net"
+    )
+    parser.add_argument("--widths", type=_parse_list(float), default=[0.25, 0.5, 1.0],
+                        help="multiplicateurs de largeur à tester, ex: 0.5,1")
+    parser.add_argument("--depths", type=_parse_list(int), default=[2, 3],
+                        help="nombres de blocs de downsampling à tester, ex: 2,3,4")
+    parser.add_argument("--blocks", type=_parse_list(str), default=["separable"],
+                        help="types de blocs à tester: separable,conv")
+    parser.add_argument("--batch-sizes", type=_parse_list(int), default=[1, 8, 32],
+                        help="tailles de batch pour la latence")
+    parser.add_argument("--repeats", type=int, default=10)
+    # utilisé en interne: une variante par processus (pic mémoire indépendant)
+    parser.add_argument("--run", nargs=3, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        width, depth, block = args.run
+        print(json.dumps(measure(float(width), int(depth), block, args.batch_sizes,
+                                 args.repeats)))
+        sys.exit(0)
+
+    latency_header = " | ".join(f"ms (batch {bs})" for bs in args.batch_sizes)
+    print(f"largeur | profondeur | bloc      | paramètres | GFLOPs | {latency_header} | pic Mo")
+    for width, depth, block in itertools.product(args.widths, args.depths, args.blocks):
+        out = subprocess.run(
+            [sys.executable, __file__, "--repeats", str(args.repeats),
+             "--batch-sizes", ",".join(map(str, args.batch_sizes)),
+             "--run", str(width), str(depth), block],
+            capture_output=True, text=True,
+        )
+        lines = out.stdout.strip().splitlines()
+        prefix = f"{width:7} | {depth:10} | {block:9}"
+        if out.returncode != 0 or not lines:
+            error = out.stderr.strip().splitlines()
+            print(f"{prefix} | erreur: {error[-1] if error else ''}")
+            continue
+        stats = json.loads(lines[-1])
+        latencies = " | ".join(f"{stats['latency_ms'][str(bs)]:{len(f'ms (batch {bs})')}.1f}"
+                               for bs in args.batch_sizes)
+        print(f"{prefix} | {stats['params']:10,} | {stats['gflops']:6.2f} | {latencies} | "
+              f"{stats['peak_mb']:6.0f}")
@@ -0,0 +1,286 @@
+import os
+import pickle
+import resource
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import tensorflow as tf
+from tensorflow import keras
+
+
+def peak_rss_mb():
+    # pic de mémoire du processus (ru_maxrss est en Ko sous Linux)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class TimedSequence(keras.utils.Sequence):
+    """
+    Wraps a batch Sequence and records when each batch is ready.
+    Keras reads the batches inside the compiled training step (prefetched by
+    tf.data), so the input stall can only be measured where they are produced.
+    Batch numbers match the training steps only with fit(shuffle=False).
+    """
+
+    def __init__(self, sequence):
+        self.sequence = sequence
+        # numéro du batch -> instant (perf_counter) où il est prêt
+        self.ready = {}
+
+    def __len__(self):
+        return len(self.sequence)
+
+    def __getitem__(self, idx):
+        batch = self.sequence[idx]
+        self.ready[idx] = time.perf_counter()
+        return batch
+
+    def on_epoch_end(self):
+        if hasattr(self.sequence, "on_epoch_end"):
+            self.sequence.on_epoch_end()
+
+
+class StepTimer(keras.callbacks.Callback):
+    """
+    callback qui mesure à chaque pas d'entrainement:
+    - le temps d'attente du batch: part du pas passée avant que le batch
+      soit prêt (instant donné par le TimedSequence `data`)
+    - le temps de calcul forward/backward: reste du pas
+    sans `data` (pipeline tf.data), l'attente n'est pas mesurée
+    le premier pas de chaque fit trace la fonction d'entrainement et y lit son
+    batch: il est compté à part ("compilation"), ni en attente ni en calcul
+    écrit dans TensorBoard (log_dir/steps) et résumé à la fin de chaque époque
+    """
+
+    def __init__(self, batch_size, log_dir, data=None):
+        super().__init__()
+        self.batch_size = batch_size
+        self.data = data
+        self.writer = tf.summary.create_file_writer(os.path.join(log_dir, "steps"))
+        self.step = 0
+
+    def on_train_begin(self, logs=None):
+        self.first_step = True
+
+    def on_epoch_begin(self, epoch, logs=None):
+        self.wait_time = 0.0
+        self.compute_time = 0.0
+        self.compile_time = 0.0
+        self.steps = 0
+
+    def on_train_batch_begin(self, batch, logs=None):
+        self.batch_start = time.perf_counter()
+
+    def on_train_batch_end(self, batch, logs=None):
+        # lire la loss force la fin du calcul du pas
+        if logs and "loss" in logs:
+            float(logs["loss"])
+        end = time.perf_counter()
+        if self.first_step:
+            # traçage: le batch n'est produit qu'à l'intérieur du pas tracé
+            self.first_step = False
+            self.compile_time += end - self.batch_start
+            return
+        wait = 0.0
+        if self.data is not None and batch in self.data.ready:
+            # le pas ne peut pas commencer son calcul avant que le batch soit prêt
+            wait = min(max(self.data.ready[batch] - self.batch_start, 0.0),
+                       end - self.batch_start)
+        compute = end - self.batch_start - wait
+        self.wait_time += wait
+        self.compute_time += compute
+        self.steps += 1
+        self.step += 1
+        with self.writer.as_default(step=self.step):
+            tf.summary.scalar("data_wait_ms", 1000 * wait)
+            tf.summary.scalar("compute_ms", 1000 * compute)
+            tf.summary.scalar("samples_per_sec", self.batch_size / (wait + compute))
+
+    def on_epoch_end(self, epoch, logs=None):
+        if not self.steps:
+            return
+        total = self.wait_time + self.compute_time
+        samples_per_sec = self.steps * self.batch_size / total
+        rss = peak_rss_mb()
+        with self.writer.as_default(step=epoch):
+            tf.summary.scalar("epoch_data_wait_fraction", self.wait_time / total)
+            tf.summary.scalar("epoch_samples_per_sec", samples_per_sec)
+            tf.summary.scalar("peak_rss_mb", rss)
+        self.writer.flush()
+        if self.data is None:
+            wait = "non mesurée"
+        else:
+            wait = f"{self.wait_time:.1f}s ({100 * self.wait_time / total:.0f}%)"
+        print(
+            f"\népoque {epoch + 1}: attente des données {wait}, "
+            f"calcul {self.compute_time:.1f}s, compilation {self.compile_time:.1f}s, "
+            f"{samples_per_sec:.1f} images/s, pic mémoire {rss:.0f} Mo"
+        )
+
+
+class TimeToTarget(keras.callbacks.Callback):
+    """
+    callback qui mesure le temps d'entrainement jusqu'à la première époque
+    dont la val_loss atteint target; le chronomètre ne tourne que pendant fit
+    et continue d'un appel à l'autre (entrainement par étapes): la préparation
+    des loaders entre les étapes n'est pas comptée, comme celle faite avant
+    le premier fit
+    reached: (secondes, époque) ou None
+    """
+
+    def __init__(self, target=None):
+        super().__init__()
+        self.target = target
+        # temps passé dans les appels à fit précédents
+        self.elapsed = 0.0
+        self.start = None
+        self.reached = None
+
+    def on_train_begin(self, logs=None):
+        self.start = time.perf_counter()
+
+    def on_train_end(self, logs=None):
+        self.elapsed += time.perf_counter() - self.start
+
+    def on_epoch_end(self, epoch, logs=None):
+        if self.target is None or self.reached is not None:
+            return
+        if logs and logs.get("val_loss", float("inf")) <= self.target:
+            self.reached = (self.elapsed + time.perf_counter() - self.start, epoch + 1)
+            print(f"\nval_loss cible {self.target} atteinte en {self.reached[0]:.1f}s "
+                  f"(époque {epoch + 1})")
+
+
+def _sequences(gen):
+    # la séquence et celles qu'elle enveloppe (PrefetchLoader, AugmentedSequence...)
+    while gen is not None:
+        yield gen
+        gen = getattr(gen, "sequence", None)
+
+
+def data_state(gen):
+    """état aléatoire et ordre des indices de chaque séquence du loader"""
+    return [
+        {
+            "rng": seq.rng.get_state() if hasattr(seq, "rng") else None,
+            "indices": seq.indices.copy() if hasattr(seq, "indices") else None,
+        }
+        for seq in _sequences(gen)
+    ]
+
+
+def restore_data_state(gen, state):
+    for seq, saved in zip(_sequences(gen), state):
+        if saved["rng"] is not None:
+            seq.rng.set_state(saved["rng"])
+        if saved["indices"] is not None:
+            seq.indices[:] = saved["indices"]
+        if hasattr(seq, "close"):
+            # batches déjà préparés (PrefetchLoader) avec l'ancien ordre
+            seq.close()
+
+
+def load_train_state(path):
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def restore_train_state(model, state):
+    """
+    poids et variables de l'optimiseur (moments, compteur de pas) d'un
+    état écrit par BackgroundCheckpoint; le modèle doit être compilé
+    """
+    model.set_weights(state["weights"])
+    model.optimizer.build(model.trainable_variables)
+    for variable, value in zip(model.optimizer.variables, state["optimizer"]):
+        variable.assign(value)
+
+
+class BackgroundCheckpoint(keras.callbacks.Callback):
+    """
+    callback qui enregistre à la fin de chaque époque l'état complet de
+    l'entrainement (poids, variables de l'optimiseur, époque, état aléatoire
+    et ordre des données du loader `data`) dans path
+    les valeurs sont copiées sur le thread d'entrainement, l'écriture du
+    fichier est faite par un thread en arrière-plan (au plus une à la fois);
+    le fichier est remplacé atomiquement: un arrêt pendant l'écriture laisse
+    l'état précédent intact
+    best_path: meilleur modèle (val_loss minimale), enregistré aussi par le
+    thread d'écriture (remplace ModelCheckpoint(save_best_only=True)): les
+    poids sont copiés dans une copie du modèle, enregistrée sans les
+    variables de l'optimiseur
+    extra: {nom: objet avec get_state()} dont l'état est enregistré aussi
+    (state["extra"][nom], ex: losses de hard_examples.HardExampleSampler)
+    restore: état des données (data_state) à remettre au début de fit, après
+    l'appel à on_epoch_end de la séquence et les batches lus par Keras pour
+    déterminer leur forme (sinon l'ordre restauré serait re-mélangé)
+    """
+
+    def __init__(self, path, data=None, stage=0, history=None, restore=None, best_path=None):
+        super().__init__()
+        self.path = path
+        self.best_path = best_path
+        self._best_model = None
+        self.data = data
+        self.stage = stage
+        self.restore = restore
+        self.extra = {}
+        # val_loss des époques précédentes (reprise)
+        self.history = list(history or [])
+        self._writer = ThreadPoolExecutor(1)
+        self._pending = None
+        self.write_time = 0.0
+
+    def on_train_begin(self, logs=None):
+        if self.best_path is not None and self._best_model is None:
+            # architecture seule: ses poids ne sont modifiés que par le thread d'écriture
+            self._best_model = keras.models.clone_model(self.model)
+        if self.restore is not None:
+            restore_data_state(self.data, self.restore)
+            self.restore = None
+
+    def on_epoch_end(self, epoch, logs=None):
+        val_loss = (logs or {}).get("val_loss")
+        previous = [v for v in self.history if v is not None]
+        best = (self.best_path is not None and val_loss is not None
+                and (not previous or val_loss < min(previous)))
+        self.history.append(val_loss)
+        state = {
+            "epoch": epoch,
+            "stage": self.stage,
+            "weights": self.model.get_weights(),
+            "optimizer": [np.array(v) for v in self.model.optimizer.variables],
+            # le loader a déjà mélangé les données de l'époque suivante
+            "data": data_state(self.data),
+            "numpy_rng": np.random.get_state(),
+            "history": list(self.history),
+            "extra": {name: obj.get_state() for name, obj in self.extra.items()},
+        }
+        self.wait()
+        self._pending = self._writer.submit(self._write, state, best)
+
+    def _write(self, state, best=False):
+        start = time.perf_counter()
+        if best:
+            # avant l'état: un état enregistré n'est jamais en avance sur le modèle
+            root, ext = os.path.splitext(self.best_path)
+            self._best_model.set_weights(state["weights"])
+            self._best_model.save(root + ".tmp" + ext)
+            os.replace(root + ".tmp" + ext, self.best_path)
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self.write_time += time.perf_counter() - start
+
+    def wait(self):
+        """attend la fin de l'écriture en cours"""
+        if self._pending is not None:
+            self._pending.result()
+            self._pending = None
+
+    def on_train_end(self, logs=None):
+        self.wait()
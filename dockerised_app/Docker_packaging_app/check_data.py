@@ -0,0 +1,101 @@
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image
+import numpy as np
+
+from config import load_manifest, report_path
+
+
+def _file_state(path):
+    # taille et date de modification: un fichier modifié est vérifié à nouveau
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime]
+
+
+def check_pair(input_path, target_path):
+    """
+    fonction qui vérifie une paire image/trimap:
+    - les deux fichiers se décodent
+    - l'image est en RGB, le trimap en niveaux de gris (labels 1, 2, 3)
+    - l'image et le trimap ont la même taille
+    renvoie un message d'erreur, ou None si la paire est valide
+    """
+    try:
+        with Image.open(input_path) as img:
+            img.load()
+            if img.mode != "RGB":
+                return f"image en mode {img.mode}"
+            size = img.size
+        with Image.open(target_path) as mask:
+            mask.load()
+            if mask.mode not in ("L", "P"):
+                return f"trimap en mode {mask.mode}"
+            if mask.size != size:
+                return f"tailles différentes: image {size}, trimap {mask.size}"
+            labels = np.unique(np.asarray(mask))
+            if labels.min() < 1 or labels.max() > 3:
+                return f"labels inattendus dans le trimap: {labels.tolist()}"
+    except Exception as e:
+        return f"{type(e).__name__}: {e}"
+    return None
+
+
+def _check_sample(sample):
+    state = {
+        "image": _file_state(sample["image"]),
+        "target": _file_state(sample["target"]),
+    }
+    error = check_pair(sample["image"], sample["target"])
+    return sample["stem"], dict(state, ok=error is None, error=error)
+
+
+def _is_up_to_date(sample, entry):
+    return (
+        entry["image"] == _file_state(sample["image"])
+        and entry["target"] == _file_state(sample["target"])
+    )
+
+
+def scan(workers=None):
+    """
+    vérifie toutes les paires de l'index sur un pool de processus
+    seules les paires nouvelles ou modifiées depuis le dernier rapport sont relues
+    """
+    report = {}
+    if os.path.exists(report_path):
+        with open(report_path) as f:
+            report = json.load(f)
+
+    samples = load_manifest()["samples"]
+    todo = [s for s in samples if s["stem"] not in report or not _is_up_to_date(s, report[s["stem"]])]
+    print(f"{len(todo)} paires à vérifier sur {len(samples)}")
+
+    with ProcessPoolExecutor(workers) as executor:
+        for stem, entry in executor.map(_check_sample, todo, chunksize=64):
+            report[stem] = entry
+
+    # les échantillons retirés de l'index sont retirés du rapport
+    stems = {s["stem"] for s in samples}
+    report = {stem: entry for stem, entry in report.items() if stem in stems}
+    with open(report_path, "w") as f:
+        json.dump(report, f)
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--workers", type=int, default=None,
+                        help="nombre de processus (par défaut: nombre de coeurs)")
+    args = parser.parse_args()
+
+    report = scan(args.workers)
+    bad = {stem: entry["error"] for stem, entry in report.items() if not entry["ok"]}
+    for stem, error in sorted(bad.items()):
+        print(stem, "|", error)
+    print(f"{len(bad)} paires invalides (exclues par config.py)")
@@ -1,29 +1,135 @@
+import json
 import os
-from IPython.display import Image, display
-from tensorflow.keras.preprocessing.image import load_img
-import PIL
-from PIL import ImageOps
-from tensorflow import keras
-import numpy as np
 
 input_dir = "images/"
 target_dir = "annotations/trimaps/"
+annotations_dir = "annotations/"
 img_size = (160, 160)
 num_classes = 3
 batch_size = 32
+# répertoire du cache des images prétraitées (voir data_cache.py)
+cache_dir = "cache/"
+# répertoire des fichiers TFRecord (voir tfrecords.py)
+tfrecord_dir = "tfrecords/"
+# index des images: paires image/trimap, classes et splits officiels
+manifest_path = "manifest.json"
+# rapport de vérification des images (voir check_data.py)
+report_path = "data_report.json"
 
+_annotation_files = ["list.txt", "trainval.txt", "test.txt"]
+_manifest = None
+_valid_samples = None
 
-input_img_paths = sorted(
-    [
-        os.path.join(input_dir, fname)
-        for fname in os.listdir(input_dir)
-        if fname.endswith(".jpg")
-    ]
-)
-target_img_paths = sorted(
-    [
-        os.path.join(target_dir, fname)
-        for fname in os.listdir(target_dir)
-        if fname.endswith(".png") and not fname.startswith(".")
-    ]
-)
+
+def _read_annotation_file(fname):
+    with open(os.path.join(annotations_dir, fname)) as f:
+        return [line.split() for line in f if line.strip() and not line.startswith("#")]
+
+
+def build_manifest():
+    """
+    fonction qui construit l'index des images à partir de annotations/list.txt:
+    chaque image est associée à son trimap par son nom (sans extension)
+    et au split officiel (trainval.txt / test.txt)
+    """
+    split_of = {}
+    for fname in ["trainval.txt", "test.txt"]:
+        for row in _read_annotation_file(fname):
+            split_of[row[0]] = fname[:-4]
+
+    samples = []
+    for stem, class_id, species, breed_id in _read_annotation_file("list.txt"):
+        input_path = os.path.join(input_dir, stem + ".jpg")
+        target_path = os.path.join(target_dir, stem + ".png")
+        if not (os.path.exists(input_path) and os.path.exists(target_path)):
+            continue
+        samples.append({
+            "stem": stem,
+            "image": input_path,
+            "target": target_path,
+            "class_id": int(class_id),
+            "species": int(species),
+            "breed_id": int(breed_id),
+            "split": split_of.get(stem, "trainval"),
+        })
+    samples.sort(key=lambda sample: sample["image"])
+
+    manifest = {"samples": samples}
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f)
+    return manifest
+
+
+def _manifest_is_stale():
+    if not os.path.exists(manifest_path):
+        return True
+    mtime = os.path.getmtime(manifest_path)
+    return any(
+        os.path.getmtime(os.path.join(annotations_dir, fname)) > mtime
+        for fname in _annotation_files
+    )
+
+
+def load_manifest():
+    """
+    charge l'index (construit une seule fois, puis relu depuis manifest.json)
+    """
+    global _manifest
+    if _manifest is None:
+        if _manifest_is_stale():
+            _manifest = build_manifest()
+        else:
+            with open(manifest_path) as f:
+                _manifest = json.load(f)
+    return _manifest
+
+
+def _bad_stems():
+    if not os.path.exists(report_path):
+        return set()
+    with open(report_path) as f:
+        report = json.load(f)
+    return {stem for stem, entry in report.items() if not entry["ok"]}
+
+
+def valid_samples():
+    """
+    échantillons de l'index, sans les paires signalées invalides par check_data.py
+    """
+    global _valid_samples
+    if _valid_samples is None:
+        bad_stems = _bad_stems()
+        _valid_samples = [s for s in load_manifest()["samples"] if s["stem"] not in bad_stems]
+    return _valid_samples
+
+
+def get_samples(split=None):
+    """
+    liste des échantillons du split demandé ("trainval", "test" ou None pour tous)
+    """
+    return [s for s in valid_samples() if split is None or s["split"] == split]
+
+
+def get_paths(split=None):
+    samples = get_samples(split)
+    return [s["image"] for s in samples], [s["target"] for s in samples]
+
+
+def get_split_indices(split):
+    """
+    positions (dans get_paths()) des échantillons du split demandé
+    """
+    return [i for i, s in enumerate(valid_samples()) if s["split"] == split]
+
+
+_paths = {}
+
+
+def __getattr__(name):
+    # input_img_paths et target_img_paths sont chargés au premier accès
+    # (from config import input_img_paths)
+    if name in ("input_img_paths", "target_img_paths"):
+        if not _paths:
+            _paths["input_img_paths"], _paths["target_img_paths"] = get_paths()
+        return _paths[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
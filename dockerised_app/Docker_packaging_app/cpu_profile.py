@@ -0,0 +1,86 @@
+import argparse
+import itertools
+import subprocess
+import sys
+import time
+
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+
+from config import batch_size, img_size, num_classes
+from seg_model import get_model
+
+
+def configure_cpu(intra_op_threads=None, inter_op_threads=None, mixed_precision=False):
+    """
+    réglages CPU de TensorFlow, à appeler avant de créer le modèle:
+    - nombre de threads par opération (intra) et d'opérations en parallèle (inter)
+    - mixed_precision: calculs en bfloat16, variables en float32
+    """
+    if intra_op_threads:
+        tf.config.threading.set_intra_op_parallelism_threads(intra_op_threads)
+    if inter_op_threads:
+        tf.config.threading.set_inter_op_parallelism_threads(inter_op_threads)
+    if mixed_precision:
+        keras.mixed_precision.set_global_policy("mixed_bfloat16")
+
+
+def measure(intra_op_threads, inter_op_threads, jit_compile, mixed_precision, steps=10):
+    """
+    nombre d'images/seconde à l'entrainement pour une configuration
+    (batches aléatoires: seul le calcul est mesuré, pas le chargement des données)
+    """
+    configure_cpu(intra_op_threads, inter_op_threads, mixed_precision)
+    net = get_model(img_size, num_classes)
+    net.compile(optimizer="rmsprop", loss="sparse_categorical_crossentropy",
+                jit_compile=jit_compile)
+
+    x = np.random.uniform(0, 255, (batch_size,) + img_size + (3,)).astype("float32")
+    y = np.random.randint(0, num_classes, (batch_size,) + img_size + (1,)).astype("uint8")
+    # premier pas: compilation du graphe (non mesuré)
+    net.train_on_batch(x, y)
+    start = time.perf_counter()
+    for _ in range(steps):
+        net.train_on_batch(x, y)
+    return steps * batch_size / (time.perf_counter() - start)
+
+
+def _parse_list(value):
+    return [int(v) for v in value.split(",")]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="compare les débits d'entrainement (images/s) de plusieurs réglages CPU"
+    )
+    parser.add_argument("--intra", type=_parse_list, default=[0],
+                        help="threads intra-op à tester, ex: 4,8,16 (0: défaut TF)")
+    parser.add_argument("--inter", type=_parse_list, default=[0],
+                        help="threads inter-op à tester, ex: 1,2 (0: défaut TF)")
+    parser.add_argument("--jit", action="store_true", help="tester aussi jit_compile (XLA)")
+    parser.add_argument("--bf16", action="store_true", help="tester aussi mixed_bfloat16")
+    parser.add_argument("--steps", type=int, default=10)
+    # utilisé en interne: une configuration par processus
+    # (les threads de TF ne peuvent plus être changés une fois TF initialisé)
+    parser.add_argument("--run", nargs=4, type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        intra, inter, jit, bf16 = args.run
+        print(measure(intra, inter, bool(jit), bool(bf16), args.steps))
+        sys.exit(0)
+
+    grid = itertools.product(
+        args.intra, args.inter, [0, 1] if args.jit else [0], [0, 1] if args.bf16 else [0]
+    )
+    print("intra | inter | jit | bf16 | images/s")
+    for intra, inter, jit, bf16 in grid:
+        out = subprocess.run(
+            [sys.executable, __file__, "--steps", str(args.steps),
+             "--run", str(intra), str(inter), str(jit), str(bf16)],
+            capture_output=True, text=True,
+        )
+        lines = out.stdout.strip().splitlines()
+        result = f"{float(lines[-1]):.1f}" if out.returncode == 0 and lines else "erreur"
+        print(f"{intra:5} | {inter:5} | {jit:3} | {bf16:4} | {result}")
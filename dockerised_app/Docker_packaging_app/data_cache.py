@@ -0,0 +1,85 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+from config import cache_dir
+from image_io import load_input, load_target
+
+
+def cache_key(img_size, input_img_paths, target_img_paths, boxes=None):
+    """
+    clé du cache: dépend de la taille des images, de la liste des fichiers
+    et des zones découpées (mode ROI)
+    """
+    h = hashlib.sha1()
+    h.update(repr(tuple(img_size)).encode())
+    if boxes is not None:
+        h.update(np.ascontiguousarray(boxes, dtype="int32").tobytes())
+    for input_path, target_path in zip(input_img_paths, target_img_paths):
+        h.update(input_path.encode())
+        h.update(b"|")
+        h.update(target_path.encode())
+        h.update(b"\n")
+    return h.hexdigest()[:16]
+
+
+def _cache_paths(key, cache_dir):
+    prefix = os.path.join(cache_dir, key)
+    return prefix + "_x.npy", prefix + "_y.npy", prefix + ".json"
+
+
+def build_cache(img_size, input_img_paths, target_img_paths, cache_dir=cache_dir, boxes=None):
+    """
+    fonction qui décode et redimensionne une seule fois toutes les images
+    et les écrit dans deux tableaux uint8 sur disque (memory-mapped):
+    - x: (N, H, W, 3) pixels
+    - y: (N, H, W, 1) labels 0, 1, 2
+    boxes: zone découpée dans chaque image (voir roi.py), ou None
+    renvoie la clé du cache (rien n'est recalculé si le cache existe déjà)
+    """
+    key = cache_key(img_size, input_img_paths, target_img_paths, boxes)
+    x_path, y_path, meta_path = _cache_paths(key, cache_dir)
+    if os.path.exists(meta_path):
+        return key
+
+    os.makedirs(cache_dir, exist_ok=True)
+    n = len(input_img_paths)
+    x = np.lib.format.open_memmap(
+        x_path + ".tmp", mode="w+", dtype="uint8", shape=(n,) + tuple(img_size) + (3,)
+    )
+    y = np.lib.format.open_memmap(
+        y_path + ".tmp", mode="w+", dtype="uint8", shape=(n,) + tuple(img_size) + (1,)
+    )
+    for i, (input_path, target_path) in enumerate(zip(input_img_paths, target_img_paths)):
+        box = None if boxes is None else boxes[i]
+        x[i] = load_input(input_path, img_size, box=box)
+        y[i, ..., 0] = load_target(target_path, img_size, box=box)
+        if (i + 1) % 1000 == 0:
+            print(f"cache: {i + 1}/{n} images")
+    x.flush()
+    y.flush()
+    del x, y
+    os.replace(x_path + ".tmp", x_path)
+    os.replace(y_path + ".tmp", y_path)
+
+    # le fichier json est écrit en dernier: il indique que le cache est complet
+    with open(meta_path, "w") as f:
+        json.dump({"img_size": list(img_size), "num_samples": n}, f)
+    return key
+
+
+def open_cache(key, cache_dir=cache_dir):
+    """
+    ouvre les tableaux du cache en lecture seule (sans les charger en RAM)
+    """
+    x_path, y_path, _ = _cache_paths(key, cache_dir)
+    return np.load(x_path, mmap_mode="r"), np.load(y_path, mmap_mode="r")
+
+
+if __name__ == "__main__":
+    from config import img_size, input_img_paths, target_img_paths
+
+    key = build_cache(img_size, input_img_paths, target_img_paths)
+    print("cache prêt:", key)
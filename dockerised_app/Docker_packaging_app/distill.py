@@ -0,0 +1,178 @@
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+
+# les U-Net étroits (width <= 0.375) plantent à l'entrainement (segfault)
+# avec les noyaux oneDNN de certaines versions de TensorFlow pour CPU:
+# désactivés avant l'import de TensorFlow (TF_ENABLE_ONEDNN_OPTS=1 pour les garder);
+# la latence est mesurée avec les réglages d'origine (default_summary)
+_default_env = dict(os.environ)
+os.environ.setdefault("TF_ENABLE_ONEDNN_OPTS", "0")
+
+import numpy as np
+from tensorflow import keras
+
+from config import batch_size, cache_dir, img_size, num_classes, get_paths
+from data_cache import build_cache, open_cache
+from evaluate import evaluate, iou
+from get_data_info import CachedOxfordPets, split_indices
+from seg_model import get_model
+
+
+def default_summary(model_path):
+    """
+    model_stats.summary du modèle enregistré, mesuré dans un sous-processus
+    avec l'environnement d'origine: la latence est celle des noyaux CPU par
+    défaut, pas celle de l'entrainement sans oneDNN
+    """
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "model_stats.py")
+    out = subprocess.run([sys.executable, script, model_path], env=_default_env,
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def build_soft_targets(teacher_path, x, indices, cache_dir=cache_dir, predict_batch=64):
+    """
+    fonction qui calcule une seule fois les probabilités par pixel du modèle
+    enseignant pour les images `indices` du cache x, et les écrit dans un
+    tableau float16 (len(indices), H, W, num_classes) sur disque (memory-mapped),
+    lignes dans l'ordre croissant des indices
+    renvoie (tableau en lecture seule, indices triés)
+    """
+    rows = np.sort(np.asarray(indices))
+    # la clé dépend du modèle enseignant (contenu) et des images
+    h = hashlib.sha1()
+    with open(teacher_path, "rb") as f:
+        h.update(f.read())
+    h.update(repr(x.shape).encode())
+    h.update(rows.tobytes())
+    prefix = os.path.join(cache_dir, "soft_" + h.hexdigest()[:16])
+    soft_path, meta_path = prefix + ".npy", prefix + ".json"
+
+    if not os.path.exists(meta_path):
+        teacher = keras.models.load_model(teacher_path, compile=False)
+        input_dtype = teacher.inputs[0].dtype
+        os.makedirs(cache_dir, exist_ok=True)
+        soft = np.lib.format.open_memmap(soft_path + ".tmp", mode="w+", dtype="float16",
+                                         shape=(len(rows),) + x.shape[1:3] + (num_classes,))
+        for i in range(0, len(rows), predict_batch):
+            batch = x[rows[i : i + predict_batch]].astype(input_dtype)
+            soft[i : i + len(batch)] = teacher.predict_on_batch(batch)
+            if (i // predict_batch + 1) % 20 == 0:
+                print(f"cibles de l'enseignant: {i + len(batch)}/{len(rows)} images")
+        soft.flush()
+        del soft
+        os.replace(soft_path + ".tmp", soft_path)
+        # le fichier json est écrit en dernier: il indique que le cache est complet
+        with open(meta_path, "w") as f:
+            json.dump({"teacher": teacher_path, "num_samples": len(rows)}, f)
+    return np.load(soft_path, mmap_mode="r"), rows
+
+
+class DistillPets(CachedOxfordPets):
+    """
+    Same batches as CachedOxfordPets, with the teacher's probabilities appended
+    to the labels: targets are (B, H, W, num_classes + 1), soft targets first.
+    Without soft targets (validation), the one-hot labels take their place.
+    """
+
+    def __init__(self, batch_size, x, y, indices, soft=None, soft_rows=None, shuffle=False,
+                 seed=None):
+        super().__init__(batch_size, x, y, indices, shuffle=shuffle, seed=seed, uint8=True)
+        self.soft = soft
+        self.soft_rows = soft_rows
+
+    def __getitem__(self, idx):
+        x, y = super().__getitem__(idx)
+        batch_indices = np.sort(self.batch_indices(idx))
+        if self.soft is None:
+            soft = np.eye(num_classes, dtype="float32")[y[..., 0]]
+        else:
+            soft = self.soft[np.searchsorted(self.soft_rows, batch_indices)].astype("float32")
+        return x, np.concatenate([soft, y.astype("float32")], axis=-1)
+
+
+def distillation_loss(alpha=0.5, temperature=2.0):
+    """
+    alpha * entropie croisée avec les probabilités de l'enseignant (adoucies
+    par la température) + (1 - alpha) * entropie croisée avec les trimaps
+    """
+    ops = keras.ops
+
+    def loss(y_true, y_pred):
+        soft, labels = y_true[..., :num_classes], y_true[..., num_classes]
+        # adoucissement: softmax(log(p) / T) pour l'enseignant et l'élève
+        log_pred = ops.log(ops.clip(y_pred, 1e-7, 1.0))
+        soft = ops.softmax(ops.log(ops.clip(soft, 1e-7, 1.0)) / temperature)
+        soft_pred = ops.log_softmax(log_pred / temperature)
+        # T**2: même ordre de grandeur des gradients quelle que soit la température
+        soft_loss = -ops.sum(soft * soft_pred, axis=-1) * temperature ** 2
+        hard_loss = keras.losses.sparse_categorical_crossentropy(labels, y_pred)
+        return alpha * soft_loss + (1 - alpha) * hard_loss
+
+    return loss
+
+
+def distill(teacher_path, width=0.25, depth=3, block="separable", alpha=0.5, temperature=2.0,
+            epochs=10, output="oxford_segmentation_student.h5"):
+    """
+    entraine un U-Net étroit sur un mélange des probabilités de l'enseignant
+    (calculées une fois et gardées sur disque) et des trimaps
+    """
+    input_img_paths, target_img_paths = get_paths()
+    train_indices, val_indices = split_indices()
+    x, y = open_cache(build_cache(img_size, input_img_paths, target_img_paths))
+    soft, soft_rows = build_soft_targets(teacher_path, x, train_indices)
+
+    train_gen = DistillPets(batch_size, x, y, train_indices, soft, soft_rows, shuffle=True,
+                            seed=42)
+    val_gen = DistillPets(batch_size, x, y, val_indices)
+
+    student = get_model(img_size, num_classes, input_dtype="uint8", width=width, depth=depth,
+                        block=block)
+    student.compile(optimizer="rmsprop", loss=distillation_loss(alpha, temperature))
+    student.fit(train_gen, epochs=epochs, validation_data=val_gen, shuffle=False, verbose=1,
+                callbacks=[keras.callbacks.ModelCheckpoint(output, save_best_only=True)])
+    return keras.models.load_model(output, compile=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="distillation du U-Net dans un modèle étroit",
+        epilog="les noyaux oneDNN de TensorFlow sont désactivés par défaut "
+               "(TF_ENABLE_ONEDNN_OPTS=0): avec certaines versions, l'entrainement des "
+               "modèles étroits plante; TF_ENABLE_ONEDNN_OPTS=1 pour les réactiver. "
+               "La latence est mesurée dans un sous-processus avec les réglages par défaut",
+    )
+    parser.add_argument("--teacher", default="oxford_segmentation.h5")
+    parser.add_argument("--output", default="oxford_segmentation_student.h5")
+    parser.add_argument("--width", type=float, default=0.25,
+                        help="multiplicateur de largeur de l'élève (voir seg_model.get_model)")
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--block", choices=["separable", "conv"], default="separable")
+    parser.add_argument("--alpha", type=float, default=0.5,
+                        help="poids des cibles de l'enseignant (1 - alpha: trimaps)")
+    parser.add_argument("--temperature", type=float, default=2.0)
+    parser.add_argument("--epochs", type=int, default=10)
+    args = parser.parse_args()
+
+    student = distill(args.teacher, args.width, args.depth, args.block, args.alpha,
+                      args.temperature, args.epochs, args.output)
+    teacher = keras.models.load_model(args.teacher, compile=False)
+
+    _, val_indices = split_indices()
+    print(f"\n{'':<10} {'paramètres':>12} {'GFLOPs':>8} {'latence (ms)':>13} {'mIoU':>6}")
+    results = {}
+    for name, model, path in [("enseignant", teacher, args.teacher),
+                              ("élève", student, args.output)]:
+        stats = default_summary(path)
+        cm, _, _ = evaluate(model, val_indices)
+        results[name] = (stats["latency_ms"], np.nanmean(iou(cm.sum(axis=0))))
+        print(f"{name:<10} {stats['params']:>12,} {stats['gflops']:>8.2f} "
+              f"{stats['latency_ms']:>13.1f} {results[name][1]:>6.3f}")
+    (teacher_ms, teacher_miou), (student_ms, student_miou) = results.values()
+    print(f"\nélève: latence x{student_ms / teacher_ms:.2f}, "
+          f"écart de mIoU {teacher_miou - student_miou:+.3f}")
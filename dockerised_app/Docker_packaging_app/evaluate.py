@@ -0,0 +1,109 @@
+import argparse
+import time
+
+import numpy as np
+from tensorflow import keras
+
+from config import batch_size, img_size, num_classes, get_paths, get_samples
+from get_data_info import OxfordPets, split_indices
+from prefetch_loader import PrefetchLoader
+
+# labels des trimaps après soustraction de 1
+class_names = ["animal", "fond", "contour"]
+species_names = {1: "chat", 2: "chien"}
+
+
+def confusion_matrix(y_true, y_pred, groups=None, num_groups=1, num_classes=num_classes):
+    """
+    matrice de confusion des pixels (vrai x prédit) calculée avec un bincount
+    groups: numéro de groupe de chaque image du batch -> une matrice par groupe
+    renvoie un tableau (num_groups, num_classes, num_classes)
+    """
+    b = len(y_true)
+    codes = num_classes * y_true.reshape(b, -1).astype("int64") + y_pred.reshape(b, -1)
+    if groups is not None:
+        codes += (num_classes * num_classes) * np.asarray(groups, dtype="int64")[:, None]
+    counts = np.bincount(codes.ravel(), minlength=num_groups * num_classes * num_classes)
+    return counts.reshape(num_groups, num_classes, num_classes)
+
+
+def iou(cm):
+    """IoU de chaque classe à partir d'une matrice de confusion"""
+    tp = np.diag(cm).astype("float64")
+    union = cm.sum(axis=0) + cm.sum(axis=1) - tp
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(union > 0, tp / union, np.nan)
+
+
+def predict_labels(model, x):
+    # le modèle peut attendre des uint8 (get_model(input_dtype="uint8"))
+    x = x.astype(model.inputs[0].dtype)
+    return np.argmax(model.predict_on_batch(x), axis=-1)
+
+
+def evaluate(model, indices, batch_size=batch_size, workers=4):
+    """
+    parcourt les images indices par batches et accumule une matrice de confusion
+    par race (class_id de annotations/list.txt), sans garder les prédictions
+    renvoie (matrices par race, nombre d'images, durée)
+    """
+    input_img_paths, target_img_paths = get_paths()
+    class_ids = np.array([s["class_id"] for s in get_samples()])
+    num_groups = class_ids.max() + 1
+    cm = np.zeros((num_groups, num_classes, num_classes), dtype="int64")
+
+    start = time.perf_counter()
+    seq = OxfordPets(batch_size, img_size, input_img_paths, target_img_paths, indices)
+    # les images du batch suivant sont décodées pendant la prédiction
+    loader = PrefetchLoader(seq, workers) if workers else seq
+    for i in range(len(seq)):
+        x, y = loader[i]
+        cm += confusion_matrix(y[..., 0], predict_labels(model, x),
+                               class_ids[seq.batch_indices(i)], num_groups)
+    if workers:
+        loader.close()
+
+    # dernières images (batch incomplet)
+    rest = np.asarray(indices)[len(seq) * batch_size:]
+    if len(rest):
+        x, y = OxfordPets(len(rest), img_size, input_img_paths, target_img_paths, rest)[0]
+        cm += confusion_matrix(y[..., 0], predict_labels(model, x), class_ids[rest], num_groups)
+    return cm, len(indices), time.perf_counter() - start
+
+
+def print_report(cm):
+    samples = get_samples()
+    breeds = {s["class_id"]: (s["stem"].rsplit("_", 1)[0], s["species"]) for s in samples}
+
+    total = cm.sum(axis=0)
+    ious = iou(total)
+    print("IoU par classe:", ", ".join(f"{n} {v:.3f}" for n, v in zip(class_names, ious)))
+    print(f"mIoU {np.nanmean(ious):.3f} | précision pixels {np.trace(total) / total.sum():.3f}")
+
+    print("\nmIoU par espèce:")
+    for species, name in species_names.items():
+        ids = [c for c, (_, s) in breeds.items() if s == species]
+        print(f"  {name:<28} {np.nanmean(iou(cm[ids].sum(axis=0))):.3f}")
+
+    print("\nmIoU par race:")
+    for class_id, (breed, _) in sorted(breeds.items(), key=lambda item: item[1][0].lower()):
+        if cm[class_id].sum():
+            print(f"  {breed:<28} {np.nanmean(iou(cm[class_id])):.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", default="oxford_segmentation.h5")
+    parser.add_argument("--split", choices=["val", "test"], default="val",
+                        help="val: validation du split aléatoire de train_model.py, "
+                             "test: split officiel annotations/test.txt")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=4,
+                        help="threads de chargement des images (0: aucun)")
+    args = parser.parse_args()
+
+    model = keras.models.load_model(args.model, compile=False)
+    _, indices = split_indices("random" if args.split == "val" else "official")
+    cm, n, duration = evaluate(model, indices, args.batch_size, args.workers)
+    print(f"{n} images évaluées en {duration:.1f}s ({n / duration:.1f} images/s)\n")
+    print_report(cm)
@@ -0,0 +1,119 @@
+import argparse
+import os
+import time
+
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+
+from config import img_size, num_classes, get_paths
+from evaluate import confusion_matrix, iou
+from get_data_info import OxfordPets, split_indices
+
+
+def fixed_batch_model(model):
+    """
+    copie du modèle avec une taille de batch fixée à 1
+    (le convertisseur TFLite ne gère pas les UpSampling2D à batch variable)
+    """
+    inputs = keras.Input(batch_shape=(1,) + img_size + (3,), dtype=model.inputs[0].dtype)
+    fixed = keras.models.clone_model(model, input_tensors=inputs)
+    fixed.set_weights(model.get_weights())
+    return fixed
+
+
+def representative_images(num_images=100):
+    """images du jeu d'entrainement pour calibrer la quantification int8"""
+    input_img_paths, target_img_paths = get_paths()
+    train_indices, _ = split_indices()
+    seq = OxfordPets(1, img_size, input_img_paths, target_img_paths, train_indices[:num_images])
+    for i in range(len(seq)):
+        yield seq[i][0]
+
+
+def convert(model, variant, num_calibration_images=100):
+    """
+    conversion TFLite:
+    - "float16": poids en float16
+    - "int8": poids et activations en int8, entrée et sortie en uint8
+    """
+    converter = tf.lite.TFLiteConverter.from_keras_model(fixed_batch_model(model))
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if variant == "float16":
+        converter.target_spec.supported_types = [tf.float16]
+    elif variant == "int8":
+        input_dtype = model.inputs[0].dtype
+        converter.representative_dataset = lambda: (
+            [x.astype(input_dtype)] for x in representative_images(num_calibration_images)
+        )
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.uint8
+        converter.inference_output_type = tf.uint8
+    return converter.convert()
+
+
+class TFLiteSegmenter:
+    """Predicts label maps, one image at a time, with a TFLite model."""
+
+    def __init__(self, model_content, num_threads=None):
+        self.interpreter = tf.lite.Interpreter(model_content=model_content,
+                                               num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self.input = self.interpreter.get_input_details()[0]
+        self.output = self.interpreter.get_output_details()[0]
+
+    def __call__(self, x):
+        scale, zero_point = self.input["quantization"]
+        if np.issubdtype(self.input["dtype"], np.integer) and scale:
+            # quantification de l'entrée (modèle int8)
+            x = np.round(x.astype("float32") / scale + zero_point)
+            x = np.clip(x, 0, 255)
+        self.interpreter.set_tensor(self.input["index"], x[None].astype(self.input["dtype"]))
+        self.interpreter.invoke()
+        # l'argmax est le même sur la sortie quantifiée
+        return np.argmax(self.interpreter.get_tensor(self.output["index"])[0], axis=-1)
+
+
+def compare(predictors, num_images=200):
+    """
+    latence moyenne par image et mIoU de chaque modèle sur les images de validation
+    """
+    input_img_paths, target_img_paths = get_paths()
+    _, val_indices = split_indices()
+    seq = OxfordPets(1, img_size, input_img_paths, target_img_paths, val_indices[:num_images])
+    results = {name: [np.zeros((1, num_classes, num_classes), dtype="int64"), 0.0]
+               for name in predictors}
+    for i in range(len(seq)):
+        x, y = seq[i]
+        for name, predict in predictors.items():
+            start = time.perf_counter()
+            labels = predict(x[0])
+            results[name][1] += time.perf_counter() - start
+            results[name][0] += confusion_matrix(y[..., 0], labels[None])
+    for name, (cm, duration) in results.items():
+        print(f"{name:<10} {1000 * duration / len(seq):8.1f} ms/image   "
+              f"mIoU {np.nanmean(iou(cm[0])):.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="export TFLite float16 et int8 du U-Net")
+    parser.add_argument("--model", default="oxford_segmentation.h5")
+    parser.add_argument("--calibration-images", type=int, default=100)
+    parser.add_argument("--eval-images", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=None, help="threads de l'interpréteur")
+    args = parser.parse_args()
+
+    model = keras.models.load_model(args.model, compile=False)
+    input_dtype = model.inputs[0].dtype
+    predictors = {
+        "keras": lambda x: np.argmax(model.predict_on_batch(x[None].astype(input_dtype))[0], axis=-1)
+    }
+    for variant in ["float16", "int8"]:
+        content = convert(model, variant, args.calibration_images)
+        path = os.path.splitext(args.model)[0] + f"_{variant}.tflite"
+        with open(path, "wb") as f:
+            f.write(content)
+        print(f"{path}: {len(content) / 1e6:.1f} Mo")
+        predictors[variant] = TFLiteSegmenter(content, args.threads)
+
+    compare(predictors, args.eval_images)
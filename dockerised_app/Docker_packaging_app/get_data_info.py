@@ -1,16 +1,18 @@
 import os
-from IPython.display import Image, display
 from tensorflow.keras.preprocessing.image import load_img
-import PIL
-from PIL import ImageOps
 from tensorflow import keras
 import numpy as np
-from config import target_img_paths
-from config import input_img_paths
+import config
+from image_io import load_input, load_target
 
 
 
 def display_images():
+    # imports ici: affichage seulement (notebook), inutiles pour l'entrainement
+    from IPython.display import Image, display
+    from PIL import ImageOps
+
+    input_img_paths, target_img_paths = config.input_img_paths, config.target_img_paths
     print("Number of samples:", len(input_img_paths))
 
     for input_path, target_path in zip(input_img_paths[:10], target_img_paths[:10]):
@@ -22,44 +24,178 @@ def display_images():
     display(Image(filename=input_img_paths[9]))
 
     # Display auto-contrast version of corresponding target (per-pixel categories)
-    img = PIL.ImageOps.autocontrast(load_img(target_img_paths[9]))
+    img = ImageOps.autocontrast(load_img(target_img_paths[9]))
     display(img)
 
+def split_indices(split="random", val_samples=1000, seed=42):
+    """
+    indices (dans config.get_paths()) des jeux d'entrainement et de validation
+    - "random": val_samples images tirées au hasard pour la validation
+    - "official": splits officiels (annotations/trainval.txt et test.txt)
+    """
+    rng = np.random.RandomState(seed)
+    if split == "official":
+        train_indices = rng.permutation(config.get_split_indices("trainval"))
+        val_indices = np.array(config.get_split_indices("test"))
+    else:
+        # Split our img paths into a training and a validation set
+        indices = rng.permutation(len(config.get_samples()))
+        train_indices = indices[:-val_samples]
+        val_indices = indices[-val_samples:]
+    return train_indices, val_indices
+
+
 class OxfordPets(keras.utils.Sequence):
-    """Helper to iterate over the data (as Numpy arrays)."""
+    """Helper to iterate over the data (as Numpy arrays).
+
+    `indices` selects (and orders) the samples of this split; with `shuffle=True`
+    a new permutation of them is drawn at the end of every epoch.
+
+    With `uint8=True` the batches are filled into a pool of `num_buffers`
+    preallocated uint8 arrays (reused in turn) instead of new float32 arrays;
+    the model then casts and scales them itself (get_model(input_dtype="uint8")).
+    `num_buffers` must exceed the number of batches in flight at once.
+
+    `decode="draft"` decodes the JPEGs at reduced resolution (see image_io.load_input).
 
-    def __init__(self, batch_size, img_size, input_img_paths, target_img_paths):
+    `boxes` (N, 4), aligned with the paths, crops every image and trimap to a
+    region of interest before resizing (see roi.py); -1 rows keep the full frame.
+    """
+
+    def __init__(self, batch_size, img_size, input_img_paths, target_img_paths,
+                 indices=None, shuffle=False, seed=None, uint8=False, num_buffers=4,
+                 decode="full", boxes=None):
         self.batch_size = batch_size
         self.img_size = img_size
+        self.decode = decode
+        self.boxes = boxes
         self.input_img_paths = input_img_paths
         self.target_img_paths = target_img_paths
+        if indices is None:
+            indices = np.arange(len(target_img_paths))
+        self.indices = np.array(indices)
+        self.shuffle = shuffle
+        self.rng = np.random.RandomState(seed)
+        self._init_buffers(uint8, num_buffers)
+
+    def _init_buffers(self, uint8, num_buffers):
+        self.uint8 = uint8
+        self._buffers = []
+        if uint8:
+            for _ in range(num_buffers):
+                self._buffers.append((
+                    np.empty((self.batch_size,) + tuple(self.img_size) + (3,), dtype="uint8"),
+                    np.empty((self.batch_size,) + tuple(self.img_size) + (1,), dtype="uint8"),
+                ))
+
+    def _new_batch(self, idx):
+        """Arrays (x, y) to fill for batch #idx."""
+        if self.uint8:
+            # buffer choisi d'après le numéro du batch (sans état partagé entre threads)
+            return self._buffers[idx % len(self._buffers)]
+        x = np.zeros((self.batch_size,) + self.img_size + (3,), dtype="float32")
+        y = np.zeros((self.batch_size,) + self.img_size + (1,), dtype="uint8")
+        return x, y
 
     def __len__(self):
-        return len(self.target_img_paths) // self.batch_size
+        return len(self.indices) // self.batch_size
+
+    def batch_indices(self, idx):
+        """Indices of the samples in batch #idx."""
+        i = idx * self.batch_size
+        return self.indices[i : i + self.batch_size]
 
     def __getitem__(self, idx):
         """Returns tuple (input, target) correspond to batch #idx."""
-        i = idx * self.batch_size
-        batch_input_img_paths = self.input_img_paths[i : i + self.batch_size]
-        batch_target_img_paths = self.target_img_paths[i : i + self.batch_size]
-        x = np.zeros((self.batch_size,) + self.img_size + (3,), dtype="float32")
-        for j, path in enumerate(batch_input_img_paths):
-            img = load_img(path, target_size=self.img_size)
+        batch_indices = self.batch_indices(idx)
+        x, y = self._new_batch(idx)
+        if self.boxes is not None:
+            # mode ROI: découpe de la zone avant le redimensionnement
+            for j, k in enumerate(batch_indices):
+                x[j] = load_input(self.input_img_paths[k], self.img_size,
+                                  draft=self.decode == "draft", box=self.boxes[k])
+                y[j, ..., 0] = load_target(self.target_img_paths[k], self.img_size,
+                                           box=self.boxes[k])
+            return x, y
+        for j, k in enumerate(batch_indices):
+            if self.decode == "draft":
+                img = load_input(self.input_img_paths[k], self.img_size, draft=True)
+            else:
+                img = load_img(self.input_img_paths[k], target_size=self.img_size)
             x[j] = img
-        y = np.zeros((self.batch_size,) + self.img_size + (1,), dtype="uint8")
-        for j, path in enumerate(batch_target_img_paths):
-            img = load_img(path, target_size=self.img_size, color_mode="grayscale")
+        for j, k in enumerate(batch_indices):
+            img = load_img(self.target_img_paths[k], target_size=self.img_size, color_mode="grayscale")
             y[j] = np.expand_dims(img, 2)
             # Ground truth labels are 1, 2, 3. Subtract one to make them 0, 1, 2:
             y[j] -= 1
         return x, y
 
+    def on_epoch_end(self):
+        if self.shuffle:
+            self.rng.shuffle(self.indices)
+
+
+class CachedOxfordPets(OxfordPets):
+    """Same batches as OxfordPets, sliced from the preprocessed cache (see data_cache.py)."""
+
+    def __init__(self, batch_size, x, y, indices=None, shuffle=False, seed=None,
+                 uint8=False, num_buffers=4):
+        if indices is None:
+            indices = np.arange(len(y))
+        self.batch_size = batch_size
+        self.img_size = x.shape[1:3]
+        self.x = x
+        self.y = y
+        self.indices = np.array(indices)
+        self.shuffle = shuffle
+        self.rng = np.random.RandomState(seed)
+        self._init_buffers(uint8, num_buffers)
+
+    def batch_indices(self, idx):
+        """Indices of the samples in batch #idx, in the order of the batch rows."""
+        # lecture des lignes du cache dans l'ordre du fichier
+        return np.sort(super().batch_indices(idx))
+
+    def __getitem__(self, idx):
+        """Returns tuple (input, target) correspond to batch #idx."""
+        batch_indices = self.batch_indices(idx)
+        if self.uint8:
+            x, y = self._new_batch(idx)
+            np.take(self.x, batch_indices, axis=0, out=x)
+            np.take(self.y, batch_indices, axis=0, out=y)
+            return x, y
+        x = self.x[batch_indices].astype("float32")
+        y = self.y[batch_indices]
+        return x, y
+
+    def __getstate__(self):
+        # les tableaux du cache (memmap, voir data_cache.open_cache) sont
+        # envoyés par chemin et rouverts par __setstate__: pickle copierait
+        # le cache entier dans chaque processus (spawn, forkserver)
+        state = self.__dict__.copy()
+        memmaps = {}
+        for name, value in self.__dict__.items():
+            if (isinstance(value, np.memmap) and value.filename
+                    and np.load(value.filename, mmap_mode="r").shape == value.shape):
+                memmaps[name] = (value.filename, value.mode)
+                state[name] = None
+        state["_memmaps"] = memmaps
+        # buffers des batches uint8: recréés vides
+        state["_buffers"] = len(self._buffers)
+        return state
 
+    def __setstate__(self, state):
+        memmaps = state.pop("_memmaps", {})
+        self.__dict__.update(state)
+        self._init_buffers(self.uint8, self._buffers)
+        for name, (filename, mode) in memmaps.items():
+            setattr(self, name, np.load(filename, mmap_mode=mode))
 
 
 
 
 if __name__ == '__main__':
+    input_img_paths, target_img_paths = config.input_img_paths, config.target_img_paths
     print("Number of samples:", len(input_img_paths))
 
 
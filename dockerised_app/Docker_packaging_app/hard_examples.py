@@ -0,0 +1,124 @@
+import argparse
+import json
+import sys
+
+import numpy as np
+import tensorflow as tf
+from tensorflow import keras
+
+import time_to_target
+from callbacks import _sequences
+
+
+def per_sample_loss(batch_size):
+    """
+    entropie croisée pixel par pixel (même loss que "sparse_categorical_crossentropy")
+    qui garde en plus la loss moyenne de chaque image du batch dans une variable
+    renvoie (fonction de loss, variable (batch_size,))
+    """
+    last = tf.Variable(tf.zeros((batch_size,)), trainable=False)
+
+    def loss(y_true, y_pred):
+        pixels = keras.losses.sparse_categorical_crossentropy(y_true, y_pred)
+        last.assign(tf.reduce_mean(tf.cast(pixels, "float32"), axis=[1, 2]))
+        return pixels
+
+    return loss, last
+
+
+class HardExampleSampler(keras.callbacks.Callback):
+    """
+    callback qui garde la dernière loss de chaque image (tableau float16,
+    une valeur par image du jeu de données) et tire les indices de l'époque
+    suivante avec une probabilité proportionnelle à cette loss:
+    une fraction `floor` de l'époque est tirée uniformément, les images
+    faciles restent donc vues; les images jamais vues ont la loss maximale
+    le nombre d'images par époque ne change pas (tirage avec remise)
+    `indices`: images du split d'entrainement, parmi num_samples
+    `data`: loader d'entrainement (les indices de la séquence sont remplacés)
+    les losses sont enregistrées avec l'état complet (BackgroundCheckpoint.extra)
+    et remises par set_state à la reprise
+    """
+
+    def __init__(self, last_losses, indices, num_samples, floor=0.2, data=None):
+        super().__init__()
+        self.last_losses = last_losses
+        self.candidates = np.unique(indices)
+        self.losses = np.full(num_samples, np.nan, dtype="float16")
+        self.floor = floor
+        self.data = data
+
+    def get_state(self):
+        return self.losses.copy()
+
+    def set_state(self, losses):
+        self.losses[:] = losses
+
+    def _sequence(self):
+        # la séquence qui porte les indices (sous PrefetchLoader, AugmentedSequence...)
+        return [seq for seq in _sequences(self.data) if hasattr(seq, "indices")][-1]
+
+    def on_train_batch_end(self, batch, logs=None):
+        # les batches sont lus dans l'ordre (shuffle=False dans fit)
+        rows = self._sequence().batch_indices(batch)
+        self.losses[rows] = self.last_losses.numpy()[: len(rows)]
+
+    def on_epoch_end(self, epoch, logs=None):
+        seq = self._sequence()
+        losses = self.losses[self.candidates].astype("float32")
+        seen = ~np.isnan(losses)
+        if not seen.any():
+            return
+        losses[~seen] = losses[seen].max()
+        p = (1 - self.floor) * losses / losses.sum() + self.floor / len(losses)
+        # tirage avec le générateur de la séquence (enregistré par BackgroundCheckpoint)
+        seq.indices[:] = seq.rng.choice(self.candidates, len(seq.indices), p=p / p.sum())
+        drawn = np.bincount(np.searchsorted(self.candidates, seq.indices),
+                            minlength=len(self.candidates))
+        print(f"\nexemples difficiles: {seen.sum()} images vues, loss moyenne "
+              f"{losses.mean():.3f}, {(drawn == 0).sum()} images non tirées pour "
+              f"l'époque suivante, au plus {drawn.max()} tirages")
+
+
+def run(floor, epochs, target_loss, checkpoint, use_cache, workers):
+    """entrainement avec tirage des exemples difficiles (floor=None: uniforme)"""
+    args = ["--run", checkpoint, "--target-loss", str(target_loss), "--epochs", str(epochs),
+            "--workers", str(workers)]
+    args += ["--uniform"] if floor is None else ["--floor", str(floor)]
+    if use_cache:
+        args.append("--cache")
+    return time_to_target.run(__file__, args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="temps pour atteindre une val_loss cible: tirage des exemples "
+                    "difficiles contre tirage uniforme"
+    )
+    parser.add_argument("--floor", type=float, default=0.2,
+                        help="fraction de chaque époque tirée uniformément")
+    parser.add_argument("--target-loss", type=float, required=True)
+    parser.add_argument("--epochs", type=int, default=10)
+    parser.add_argument("--cache", action="store_true")
+    parser.add_argument("--workers", type=int, default=0)
+    # utilisé en interne: un entrainement par processus
+    parser.add_argument("--run", help=argparse.SUPPRESS)
+    parser.add_argument("--uniform", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        from train_model import train
+
+        reached = train(use_cache=args.cache, workers=args.workers, target_loss=args.target_loss,
+                        checkpoint=args.run, epochs=args.epochs,
+                        hard_examples=None if args.uniform else args.floor)
+        print(json.dumps(reached))
+        sys.exit(0)
+
+    results = {
+        "uniforme": run(None, args.epochs, args.target_loss, "uniform.h5", args.cache,
+                        args.workers),
+        "difficiles": run(args.floor, args.epochs, args.target_loss, "hard_examples.h5",
+                          args.cache, args.workers),
+    }
+    time_to_target.print_report(args.target_loss, results)
@@ -0,0 +1,91 @@
+import time
+
+from PIL import Image
+import numpy as np
+
+
+def clip_box(box, size):
+    """
+    zone (x0, y0, x1, y1) limitée à l'image (size: largeur, hauteur);
+    None si box est None, -1 ou en dehors de l'image (image entière)
+    """
+    if box is None or box[0] < 0:
+        return None
+    x0, y0 = int(box[0]), int(box[1])
+    x1, y1 = min(int(box[2]), size[0]), min(int(box[3]), size[1])
+    if x1 <= x0 or y1 <= y0:
+        return None
+    return x0, y0, x1, y1
+
+
+def _crop(img, box, full_size):
+    # box: (x0, y0, x1, y1) en pixels de l'image d'origine (full_size),
+    # None ou -1: image entière (voir roi.py)
+    box = clip_box(box, full_size)
+    if box is None:
+        return img
+    sx, sy = img.size[0] / full_size[0], img.size[1] / full_size[1]
+    return img.crop((round(box[0] * sx), round(box[1] * sy),
+                     round(box[2] * sx), round(box[3] * sy)))
+
+
+def load_input(path, img_size, draft=False, box=None):
+    """
+    fonction qui charge une image RGB redimensionnée à img_size (hauteur, largeur)
+    (même résultat que load_img de keras: interpolation "nearest")
+    draft=True: le JPEG est décodé directement à une résolution réduite
+    (1/2, 1/4 ou 1/8, au moins img_size) avant le redimensionnement final
+    box: zone (x0, y0, x1, y1) découpée avant le redimensionnement
+    """
+    with Image.open(path) as img:
+        return prepare_input(img, img_size, draft, box)
+
+
+def prepare_input(img, img_size, draft=False, box=None):
+    """
+    même traitement que load_input pour une image déjà ouverte (Image.open,
+    pas encore décodée: img.size est la taille d'origine)
+    """
+    full_size = img.size
+    if draft:
+        # sans effet pour les fichiers qui ne sont pas des JPEG
+        crop = clip_box(box, full_size)
+        if crop is not None:
+            # la zone découpée doit garder au moins img_size pixels
+            scale = max((crop[2] - crop[0]) / img_size[1], (crop[3] - crop[1]) / img_size[0])
+            img.draft("RGB", (round(full_size[0] / scale), round(full_size[1] / scale)))
+        else:
+            img.draft("RGB", (img_size[1], img_size[0]))
+    img = _crop(img.convert("RGB"), box, full_size)
+    img = img.resize((img_size[1], img_size[0]), Image.NEAREST)
+    return np.asarray(img, dtype="uint8")
+
+
+def load_target(path, img_size, box=None):
+    """
+    fonction qui charge un trimap redimensionné à img_size
+    les labels 1, 2, 3 deviennent 0, 1, 2
+    box: zone (x0, y0, x1, y1) découpée avant le redimensionnement
+    """
+    with Image.open(path) as img:
+        img = _crop(img.convert("L"), box, img.size)
+        img = img.resize((img_size[1], img_size[0]), Image.NEAREST)
+        return np.asarray(img, dtype="uint8") - 1
+
+
+def time_decode(input_img_paths, img_size, draft):
+    start = time.perf_counter()
+    for path in input_img_paths:
+        load_input(path, img_size, draft)
+    return (time.perf_counter() - start) / len(input_img_paths)
+
+
+if __name__ == "__main__":
+    # comparaison des temps de décodage complet / réduit
+    from config import img_size, input_img_paths
+
+    paths = input_img_paths[:500]
+    full = time_decode(paths, img_size, draft=False)
+    reduced = time_decode(paths, img_size, draft=True)
+    print(f"décodage complet: {1000 * full:.2f} ms/image")
+    print(f"décodage réduit (draft): {1000 * reduced:.2f} ms/image (x{full / reduced:.1f})")
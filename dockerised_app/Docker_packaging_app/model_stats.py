@@ -0,0 +1,65 @@
+import argparse
+import json
+import time
+
+import numpy as np
+from tensorflow import keras
+from tensorflow.keras import layers
+
+
+def count_flops(model):
+    """
+    nombre d'opérations (multiplications + additions) d'une prédiction sur une image,
+    compté pour les convolutions (les autres couches sont négligeables)
+    """
+    flops = 0
+    for layer in model.layers:
+        if not isinstance(layer, (layers.Conv2D, layers.SeparableConv2D,
+                                  layers.Conv2DTranspose)):
+            continue
+        _, h, w, c_out = layer.output.shape
+        c_in = layer.input.shape[-1]
+        kh, kw = layer.kernel_size
+        if isinstance(layer, layers.SeparableConv2D):
+            # depthwise puis pointwise
+            flops += 2 * h * w * (kh * kw * c_in + c_in * c_out)
+        elif isinstance(layer, layers.Conv2DTranspose):
+            # chaque pixel d'entrée contribue à kh*kw pixels de sortie
+            _, h_in, w_in, _ = layer.input.shape
+            flops += 2 * h_in * w_in * kh * kw * c_in * c_out
+        else:
+            flops += 2 * h * w * kh * kw * c_in * c_out
+    return flops
+
+
+def measure_latency(model, batch_size=1, repeats=10):
+    """durée moyenne (secondes) d'une prédiction sur un batch d'images aléatoires"""
+    shape = (batch_size,) + tuple(model.inputs[0].shape[1:])
+    x = np.random.uniform(0, 255, shape).astype(model.inputs[0].dtype)
+    # premier appel: construction du graphe (non mesuré)
+    model.predict_on_batch(x)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        model.predict_on_batch(x)
+    return (time.perf_counter() - start) / repeats
+
+
+def summary(model, batch_size=1):
+    """paramètres, GFLOPs par image et latence CPU (ms par batch)"""
+    return {
+        "params": model.count_params(),
+        "gflops": count_flops(model) / 1e9,
+        "latency_ms": 1000 * measure_latency(model, batch_size),
+    }
+
+
+if __name__ == "__main__":
+    # utilisé par distill.py pour mesurer la latence avec les réglages
+    # TensorFlow par défaut (sous-processus)
+    parser = argparse.ArgumentParser(description="paramètres, GFLOPs et latence d'un modèle")
+    parser.add_argument("model")
+    parser.add_argument("--batch-size", type=int, default=1)
+    args = parser.parse_args()
+
+    model = keras.models.load_model(args.model, compile=False)
+    print(json.dumps(summary(model, args.batch_size)))
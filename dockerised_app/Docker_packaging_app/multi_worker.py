@@ -0,0 +1,237 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from config import batch_size, img_size, num_classes, get_paths
+
+
+def tf_config(num_workers, index, port=23456):
+    """TF_CONFIG d'un worker d'un cluster local (un port par worker)"""
+    return json.dumps({
+        "cluster": {"worker": [f"localhost:{port + k}" for k in range(num_workers)]},
+        "task": {"type": "worker", "index": index},
+    })
+
+
+def shard_indices(indices, num_workers, index):
+    """
+    part disjointe des indices pour le worker `index`; tous les workers ont le
+    même nombre d'exemples (les all-reduce demandent le même nombre de pas)
+    """
+    usable = len(indices) - len(indices) % num_workers
+    return indices[:usable][index::num_workers]
+
+
+def cpu_package(core):
+    """socket (physical_package_id) du cœur; 0 si la topologie n'est pas lisible"""
+    path = f"/sys/devices/system/cpu/cpu{core}/topology/physical_package_id"
+    try:
+        with open(path) as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return 0
+
+
+def cpu_blocks(num_workers):
+    """
+    cœurs de chaque worker, regroupés par socket (physical_package_id):
+    s'il y a au moins autant de sockets que de workers, chaque worker a des
+    sockets entiers; sinon les workers sont répartis entre les sockets et
+    chacun a un bloc de cœurs contigus d'un seul socket
+    s'il y a moins de cœurs que de workers, des workers partagent un cœur
+    """
+    sockets = {}
+    for core in sorted(os.sched_getaffinity(0)):
+        sockets.setdefault(cpu_package(core), []).append(core)
+    sockets = [sockets[p] for p in sorted(sockets)]
+
+    if num_workers <= len(sockets):
+        return [sum(sockets[k::num_workers], []) for k in range(num_workers)]
+
+    blocks = []
+    for s, cores in enumerate(sockets):
+        # workers de ce socket (les premiers sockets en ont un de plus)
+        count = num_workers // len(sockets) + (s < num_workers % len(sockets))
+        size = max(1, len(cores) // count)
+        blocks += [[cores[(k * size + j) % len(cores)] for j in range(size)]
+                   for k in range(count)]
+    return blocks
+
+
+def worker(epochs=2, steps=None, use_cache=False, uint8=False, threads=None, save=None):
+    """
+    entrainement d'un worker (TF_CONFIG défini par le lanceur):
+    chaque worker lit sa part des indices d'entrainement, les gradients sont
+    moyennés entre les workers (all-reduce sur localhost) à chaque pas
+    renvoie le débit global (images/s) des époques après la première
+    """
+    # imports ici: les réglages CPU doivent précéder l'initialisation de TensorFlow
+    from cpu_profile import configure_cpu
+
+    configure_cpu(threads, None, False)
+
+    import numpy as np
+    import tensorflow as tf
+    from tensorflow import keras
+
+    from data_cache import build_cache, open_cache
+    from get_data_info import CachedOxfordPets, OxfordPets, split_indices
+    from seg_model import get_model
+
+    strategy = tf.distribute.MultiWorkerMirroredStrategy(
+        communication_options=tf.distribute.experimental.CommunicationOptions(
+            implementation=tf.distribute.experimental.CommunicationImplementation.RING
+        )
+    )
+    num_workers = strategy.num_replicas_in_sync
+    index = strategy.cluster_resolver.task_id
+
+    input_img_paths, target_img_paths = get_paths()
+    train_indices, _ = split_indices()
+    shard = shard_indices(train_indices, num_workers, index)
+    if use_cache:
+        x, y = open_cache(build_cache(img_size, input_img_paths, target_img_paths))
+        seq = CachedOxfordPets(batch_size, x, y, shard, shuffle=True, seed=42 + index,
+                               uint8=uint8)
+    else:
+        seq = OxfordPets(batch_size, img_size, input_img_paths, target_img_paths, shard,
+                         shuffle=True, seed=42 + index, uint8=uint8)
+    steps = min(steps or len(seq), len(seq))
+
+    def batches():
+        for i in range(steps):
+            yield seq[i]
+        seq.on_epoch_end()
+
+    input_dtype = "uint8" if uint8 else "float32"
+    dataset = tf.data.Dataset.from_generator(batches, output_signature=(
+        tf.TensorSpec((batch_size,) + img_size + (3,), input_dtype),
+        tf.TensorSpec((batch_size,) + img_size + (1,), "uint8"),
+    )).prefetch(tf.data.AUTOTUNE)
+    # chaque worker fournit déjà ses propres batches (pas de re-découpage)
+    distributed = strategy.distribute_datasets_from_function(lambda context: dataset)
+
+    with strategy.scope():
+        net = get_model(img_size, num_classes, input_dtype=input_dtype)
+        optimizer = keras.optimizers.RMSprop()
+
+    @tf.function
+    def train_step(batch):
+        def step(x, y):
+            with tf.GradientTape() as tape:
+                probs = net(x, training=True)
+                loss = tf.reduce_mean(keras.losses.sparse_categorical_crossentropy(y, probs))
+                # moyenne sur les workers: l'all-reduce additionne les gradients
+                scaled = loss / num_workers
+            gradients = tape.gradient(scaled, net.trainable_variables)
+            optimizer.apply_gradients(zip(gradients, net.trainable_variables))
+            return scaled
+
+        return strategy.reduce("SUM", strategy.run(step, args=batch), axis=None)
+
+    rates = []
+    for epoch in range(epochs):
+        start = time.perf_counter()
+        total = 0.0
+        for batch in distributed:
+            total += float(train_step(batch))
+        duration = time.perf_counter() - start
+        rate = steps * batch_size * num_workers / duration
+        if index == 0:
+            print(f"époque {epoch + 1}: loss {total / steps:.4f}, {rate:.1f} images/s",
+                  file=sys.stderr)
+        # la première époque comprend la construction du graphe
+        if epoch > 0 or epochs == 1:
+            rates.append(rate)
+
+    if save and index == 0:
+        net.save(save)
+    return float(np.mean(rates))
+
+
+def launch(num_workers, port=23456, pin=True, worker_args=()):
+    """
+    lance num_workers processus locaux et renvoie le débit mesuré par le worker 0
+    pin: chaque worker est limité à un bloc de cœurs (threads TF = taille du bloc)
+    """
+    blocks = cpu_blocks(num_workers)
+    processes = []
+    for index in range(num_workers):
+        env = dict(os.environ, TF_CONFIG=tf_config(num_workers, index, port))
+        command = [sys.executable, __file__, "--worker", "--threads",
+                   str(len(blocks[index])), *worker_args]
+        preexec = (lambda cores=blocks[index]: os.sched_setaffinity(0, cores)) if pin else None
+        processes.append(subprocess.Popen(
+            command, env=env, preexec_fn=preexec, text=True,
+            stdout=subprocess.PIPE, stderr=None if index == 0 else subprocess.DEVNULL,
+        ))
+    outputs = [p.communicate()[0] for p in processes]
+    if any(p.returncode for p in processes):
+        return None
+    return json.loads(outputs[0].strip().splitlines()[-1])
+
+
+def _parse_list(value):
+    return [int(v) for v in value.split(",")]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="entrainement data-parallèle sur plusieurs processus locaux "
+                    "(MultiWorkerMirroredStrategy) et mesure du passage à l'échelle"
+    )
+    parser.add_argument("--workers", type=_parse_list, default=[1, 2, 4],
+                        help="nombres de workers à tester, ex: 1,2,4")
+    parser.add_argument("--epochs", type=int, default=2)
+    parser.add_argument("--steps", type=int, default=None, help="batches par époque et par worker")
+    parser.add_argument("--cache", action="store_true",
+                        help="utiliser le cache des images prétraitées (data_cache.py)")
+    parser.add_argument("--uint8", action="store_true")
+    parser.add_argument("--port", type=int, default=23456)
+    parser.add_argument("--no-pin", action="store_true",
+                        help="ne pas répartir les cœurs entre les workers")
+    parser.add_argument("--save", default=None, help="modèle enregistré par le worker 0")
+    # utilisé en interne: processus worker
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--threads", type=int, default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(worker(args.epochs, args.steps, args.cache, args.uint8, args.threads,
+                                args.save)))
+        sys.exit(0)
+
+    worker_args = ["--epochs", str(args.epochs)]
+    if args.steps:
+        worker_args += ["--steps", str(args.steps)]
+    if args.cache:
+        worker_args.append("--cache")
+    if args.uint8:
+        worker_args.append("--uint8")
+    if args.save:
+        worker_args += ["--save", args.save]
+
+    if args.cache:
+        # cache construit une seule fois, avant le lancement des workers
+        from data_cache import build_cache
+
+        build_cache(img_size, *get_paths())
+
+    results = {}
+    for n in args.workers:
+        print(f"\n{n} worker(s):")
+        # ports différents à chaque lancement (les précédents peuvent être en TIME_WAIT)
+        results[n] = launch(n, args.port + 100 * n, not args.no_pin, worker_args)
+
+    base = results.get(1)
+    print("\nworkers | images/s | accélération | efficacité")
+    for n, rate in results.items():
+        if rate is None:
+            print(f"{n:7} | erreur")
+        elif base:
+            print(f"{n:7} | {rate:8.1f} | {rate / base:12.2f} | {100 * rate / (n * base):9.0f}%")
+        else:
+            print(f"{n:7} | {rate:8.1f}")
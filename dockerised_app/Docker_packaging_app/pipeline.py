@@ -0,0 +1,68 @@
+import argparse
+import runpy
+import sys
+
+# point d'entrée unique: les modules lourds (TensorFlow, matplotlib, IPython)
+# ne sont importés que par les sous-commandes qui en ont besoin
+
+# sous-commandes qui exécutent le script correspondant avec les arguments restants
+# (ex: `pipeline.py train --cache --workers 4`, `pipeline.py eval --help`)
+scripts = {
+    "train": ("train_model", "entrainement du U-Net"),
+    "eval": ("evaluate", "IoU par classe et par race sur un split"),
+    "predict": ("predict", "segmentation de toutes les images d'un dossier"),
+}
+
+
+def prepare(workers=None, cache=False, tfrecords=False, split="random", num_shards=16):
+    """
+    préparation des données: index (manifest), vérification des paires,
+    et au choix cache des images prétraitées et shards TFRecord
+    """
+    from check_data import scan
+    from config import get_paths, img_size, load_manifest
+
+    samples = load_manifest()["samples"]
+    print(f"index: {len(samples)} paires")
+    report = scan(workers)
+    bad = sum(not entry["ok"] for entry in report.values())
+    print(f"{bad} paires invalides (exclues par config.py)")
+
+    if cache:
+        from data_cache import build_cache
+
+        print("cache prêt:", build_cache(img_size, *get_paths()))
+    if tfrecords:
+        # seule étape de préparation qui demande TensorFlow
+        from tfrecords import build_split_tfrecords
+
+        print("TFRecords prêts:", ", ".join(build_split_tfrecords(split, num_shards)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="pipeline de segmentation Oxford Pets")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    prepare_parser = commands.add_parser("prepare", help="index, vérification, cache des données")
+    prepare_parser.add_argument("--workers", type=int, default=None,
+                                help="processus de vérification (par défaut: nombre de coeurs)")
+    prepare_parser.add_argument("--cache", action="store_true",
+                                help="construire le cache des images prétraitées")
+    prepare_parser.add_argument("--tfrecords", action="store_true",
+                                help="écrire les shards TFRecord du split")
+    prepare_parser.add_argument("--split", choices=["random", "official"], default="random")
+    prepare_parser.add_argument("--shards", type=int, default=16)
+
+    for name, (_, description) in scripts.items():
+        # l'aide et les arguments sont ceux du script
+        commands.add_parser(name, help=description, add_help=False)
+
+    args, rest = parser.parse_known_args()
+    if args.command == "prepare":
+        if rest:
+            parser.error(f"arguments inconnus: {' '.join(rest)}")
+        prepare(args.workers, args.cache, args.tfrecords, args.split, args.shards)
+    else:
+        module = scripts[args.command][0]
+        sys.argv = [sys.argv[0]] + rest
+        runpy.run_module(module, run_name="__main__", alter_sys=True)
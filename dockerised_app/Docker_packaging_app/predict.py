@@ -0,0 +1,143 @@
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+import numpy as np
+from tensorflow import keras
+
+from config import img_size
+from image_io import prepare_input
+from roi import paste_mask, roi_boxes
+
+# couleurs des masques png: animal, fond, contour
+palette = [255, 255, 255, 0, 0, 0, 128, 128, 128]
+image_extensions = (".jpg", ".jpeg", ".png")
+
+
+def list_images(input_dir):
+    return sorted(
+        os.path.join(input_dir, fname)
+        for fname in os.listdir(input_dir)
+        if fname.lower().endswith(image_extensions) and not fname.startswith(".")
+    )
+
+
+def _decode(path, img_size, draft, box=None):
+    # un seul Image.open: taille d'origine (avant draft) et pixels
+    with Image.open(path) as img:
+        size = img.size
+        return prepare_input(img, img_size, draft, box), size
+
+
+def save_mask_png(mask, path, size=None):
+    """
+    écrit un masque (labels 0, 1, 2) en png à palette (1 octet par pixel)
+    size: (largeur, hauteur) de l'image d'origine
+    """
+    img = Image.frombuffer("P", (mask.shape[1], mask.shape[0]),
+                           np.ascontiguousarray(mask, dtype="uint8"), "raw", "P", 0, 1)
+    img.putpalette(palette)
+    if size is not None and size != img.size:
+        img = img.resize(size, Image.NEAREST)
+    img.save(path, optimize=False)
+
+
+def _save_mask(mask, path, size, box):
+    if box[0] >= 0:
+        # mode ROI: masque de la zone découpée replacé dans l'image entière
+        mask = paste_mask(mask, box, size)
+    save_mask_png(mask, path, size)
+
+
+def predict_directory(model, input_paths, output, output_format="png", batch_size=128,
+                      workers=8, draft=True, boxes=None):
+    """
+    segmente toutes les images de input_paths par grands batches:
+    les images du batch suivant sont décodées (et les masques écrits)
+    par un pool de threads pendant la prédiction du batch courant
+    - "png": un masque png à palette par image, à la taille de l'image d'origine
+    - "npy": un seul tableau uint8 (N, H, W) à la résolution du modèle
+    boxes: mode ROI, zone (x0, y0, x1, y1) de chaque image (voir roi.py); les
+    masques png sont replacés dans l'image entière, le fichier npy garde les
+    masques des zones (zones écrites dans <output>_boxes.npy)
+    """
+    n = len(input_paths)
+    roi = boxes is not None
+    if not roi:
+        boxes = np.full((n, 4), -1, dtype="int32")
+    if output_format == "npy":
+        masks_out = np.lib.format.open_memmap(output, mode="w+", dtype="uint8",
+                                              shape=(n,) + tuple(img_size))
+        with open(os.path.splitext(output)[0] + ".txt", "w") as f:
+            f.write("\n".join(input_paths))
+        if roi:
+            np.save(os.path.splitext(output)[0] + "_boxes.npy", boxes)
+    else:
+        os.makedirs(output, exist_ok=True)
+
+    input_dtype = model.inputs[0].dtype
+    batches = [input_paths[i : i + batch_size] for i in range(0, n, batch_size)]
+    with ThreadPoolExecutor(workers) as pool:
+        def submit(k):
+            return [pool.submit(_decode, path, img_size, draft, box)
+                    for path, box in zip(batches[k], boxes[k * batch_size :])]
+
+        pending = submit(0) if batches else []
+        writes = []
+        for k, batch in enumerate(batches):
+            decoded = [future.result() for future in pending]
+            if k + 1 < len(batches):
+                pending = submit(k + 1)
+
+            x = np.stack([pixels for pixels, _ in decoded]).astype(input_dtype)
+            masks = np.argmax(model.predict_on_batch(x), axis=-1).astype("uint8")
+
+            if output_format == "npy":
+                masks_out[k * batch_size : k * batch_size + len(batch)] = masks
+                continue
+            # au plus un batch de masques en attente d'écriture
+            for future in writes:
+                future.result()
+            writes = [
+                pool.submit(
+                    _save_mask, mask,
+                    os.path.join(output, os.path.splitext(os.path.basename(path))[0] + ".png"),
+                    size, box,
+                )
+                for mask, path, box, (_, size) in zip(masks, batch, boxes[k * batch_size :],
+                                                      decoded)
+            ]
+        for future in writes:
+            future.result()
+    if output_format == "npy":
+        masks_out.flush()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="segmentation de toutes les images d'un dossier")
+    parser.add_argument("input_dir")
+    parser.add_argument("output", help="dossier des masques png, ou fichier .npy")
+    parser.add_argument("--model", default="oxford_segmentation.h5")
+    parser.add_argument("--format", choices=["png", "npy"], default="png")
+    parser.add_argument("--batch-size", type=int, default=128)
+    parser.add_argument("--workers", type=int, default=8, help="threads de décodage / écriture")
+    parser.add_argument("--full-decode", action="store_true",
+                        help="décodage JPEG complet (par défaut: résolution réduite)")
+    parser.add_argument("--roi", type=float, default=None, metavar="SCALE",
+                        help="mode ROI (modèle entrainé avec train_model.py --roi SCALE): "
+                             "découpe autour de la boîte de la tête (annotations/xmls)")
+    args = parser.parse_args()
+
+    model = keras.models.load_model(args.model, compile=False)
+    paths = list_images(args.input_dir)
+    boxes = None
+    if args.roi:
+        boxes = roi_boxes([os.path.splitext(os.path.basename(p))[0] for p in paths], args.roi)
+    start = time.perf_counter()
+    predict_directory(model, paths, args.output, args.format, args.batch_size, args.workers,
+                      draft=not args.full_decode, boxes=boxes)
+    duration = time.perf_counter() - start
+    print(f"{len(paths)} images segmentées en {duration:.1f}s "
+          f"({len(paths) / duration:.1f} images/s)")
@@ -0,0 +1,81 @@
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from tensorflow import keras
+
+# séquence copiée dans chaque processus du pool (voir _init_worker)
+_worker_sequence = None
+
+
+def _init_worker(sequence):
+    global _worker_sequence
+    _worker_sequence = sequence
+
+
+def _load_batch(idx):
+    return _worker_sequence[idx]
+
+
+class PrefetchLoader(keras.utils.Sequence):
+    """Wraps a Sequence and decodes the next `queue_size` batches on a pool of workers."""
+
+    def __init__(self, sequence, num_workers=4, queue_size=8, use_processes=False):
+        self.sequence = sequence
+        self.num_workers = num_workers
+        self.queue_size = queue_size
+        self.use_processes = use_processes
+        self._executor = None
+        self._pending = {}
+        # temps passé par le modèle à attendre les données
+        self.wait_time = 0.0
+        self.batch_count = 0
+
+    def __len__(self):
+        return len(self.sequence)
+
+    def _start(self):
+        if self.use_processes:
+            self._executor = ProcessPoolExecutor(
+                self.num_workers, initializer=_init_worker, initargs=(self.sequence,)
+            )
+            self._load = _load_batch
+        else:
+            self._executor = ThreadPoolExecutor(self.num_workers)
+            self._load = self.sequence.__getitem__
+
+    def close(self):
+        if self._executor is not None:
+            for future in self._pending.values():
+                future.cancel()
+            self._executor.shutdown(wait=True)
+        self._executor = None
+        self._pending = {}
+
+    def __getitem__(self, idx):
+        """Returns tuple (input, target) correspond to batch #idx."""
+        if self._executor is None:
+            self._start()
+
+        # file d'attente bornée: au plus queue_size batches en avance
+        for j in range(idx, min(idx + self.queue_size + 1, len(self))):
+            if j not in self._pending:
+                self._pending[j] = self._executor.submit(self._load, j)
+
+        start = time.perf_counter()
+        batch = self._pending.pop(idx).result()
+        self.wait_time += time.perf_counter() - start
+        self.batch_count += 1
+        return batch
+
+    def on_epoch_end(self):
+        if self.batch_count:
+            print(
+                f"\nattente des données: {self.wait_time:.2f}s sur {self.batch_count} batches "
+                f"({1000 * self.wait_time / self.batch_count:.1f} ms/batch)"
+            )
+        self.wait_time = 0.0
+        self.batch_count = 0
+        # les workers sont relancés pour voir l'état à jour de la séquence
+        self.close()
+        if hasattr(self.sequence, "on_epoch_end"):
+            self.sequence.on_epoch_end()
@@ -0,0 +1,51 @@
+import argparse
+import json
+import sys
+
+import time_to_target
+from train_model import _parse_schedule
+
+
+def run(schedule, epochs, target_loss, checkpoint, use_cache, workers):
+    """entrainement avec tailles progressives (schedule="": taille fixe)"""
+    args = ["--run", checkpoint, "--target-loss", str(target_loss), "--epochs", str(epochs),
+            "--workers", str(workers), "--schedule", schedule]
+    if use_cache:
+        args.append("--cache")
+    return time_to_target.run(__file__, args)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="temps pour atteindre une val_loss cible: tailles progressives "
+                    "contre taille fixe"
+    )
+    parser.add_argument("--schedule", default="96:3,128:3,160:4",
+                        help="tailles progressives (taille:époques)")
+    parser.add_argument("--target-loss", type=float, required=True)
+    parser.add_argument("--cache", action="store_true")
+    parser.add_argument("--workers", type=int, default=0)
+    parser.add_argument("--epochs", type=int, default=None, help=argparse.SUPPRESS)
+    # utilisé en interne: un entrainement par processus
+    parser.add_argument("--run", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        from train_model import train
+
+        reached = train(use_cache=args.cache, workers=args.workers,
+                        schedule=_parse_schedule(args.schedule) if args.schedule else None,
+                        target_loss=args.target_loss, checkpoint=args.run,
+                        epochs=args.epochs)
+        print(json.dumps(reached))
+        sys.exit(0)
+
+    # même nombre total d'époques pour la taille fixe
+    epochs = sum(n for _, n in _parse_schedule(args.schedule))
+    results = {
+        "taille fixe": run("", epochs, args.target_loss, "fixed_size.h5", args.cache,
+                           args.workers),
+        "progressif": run(args.schedule, epochs, args.target_loss, "progressive.h5",
+                          args.cache, args.workers),
+    }
+    time_to_target.print_report(args.target_loss, results)
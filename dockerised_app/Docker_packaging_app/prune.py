@@ -0,0 +1,153 @@
+import argparse
+import os
+
+import numpy as np
+from tensorflow import keras
+from tensorflow.keras import layers
+
+from config import batch_size, img_size, num_classes, get_paths
+from get_data_info import OxfordPets, split_indices
+from model_stats import summary
+from seg_model import get_model
+
+
+def _layers_by_type(model):
+    """couches du U-Net par type, dans l'ordre du réseau"""
+    convs = [l for l in model.layers
+             if isinstance(l, layers.Conv2D) and not isinstance(l, layers.Conv2DTranspose)]
+    return {
+        "conv": convs,
+        "separable": [l for l in model.layers if isinstance(l, layers.SeparableConv2D)],
+        "transpose": [l for l in model.layers if isinstance(l, layers.Conv2DTranspose)],
+        "bn": [l for l in model.layers if isinstance(l, layers.BatchNormalization)],
+    }
+
+
+def _block_filters(model):
+    found = _layers_by_type(model)
+    down = [l.filters for l in found["separable"][1::2]]
+    up = [l.filters for l in found["transpose"][1::2]]
+    return down, up
+
+
+def rank_filters(model):
+    """
+    importance des filtres de chaque bloc: |gamma| de chacune des deux
+    BatchNormalization du bloc (un filtre peu utilisé a un gamma proche de 0);
+    le canal c de la première et le canal c de la seconde sont des filtres
+    différents, classés séparément
+    renvoie la liste des (scores 1re BN, scores 2e BN) de chaque bloc
+    (blocs descendants puis montants)
+    """
+    bns = _layers_by_type(model)["bn"][1:]
+    return [(np.abs(bns[i].gamma.numpy()), np.abs(bns[i + 1].gamma.numpy()))
+            for i in range(0, len(bns), 2)]
+
+
+def _top(scores, count):
+    # indices des `count` filtres les plus importants, dans l'ordre d'origine
+    return np.sort(np.argsort(-scores)[:count])
+
+
+def prune(model, keep=0.5):
+    """
+    construit un U-Net plus étroit qui garde, dans chaque bloc, la fraction
+    `keep` des filtres les plus importants, et y copie les poids correspondants
+    (modèle dense: les filtres sont retirés, pas mis à zéro)
+    chaque bloc garde deux ensembles de filtres de même taille: `first` pour
+    la première convolution, `second` pour la seconde, le résidu et la sortie
+    """
+    found = _layers_by_type(model)
+    if not found["separable"]:
+        raise ValueError("prune.py ne gère que les modèles à blocs SeparableConv2D")
+    kept = []
+    for first, second in rank_filters(model):
+        count = max(1, int(round(keep * len(first))))
+        kept.append((_top(first, count), _top(second, count)))
+    down, up = _block_filters(model)
+    n_down = len(down)
+
+    small = get_model(img_size, num_classes, input_dtype=model.inputs[0].dtype,
+                      down_filters=[len(k[0]) for k in kept[:n_down]],
+                      up_filters=[len(k[0]) for k in kept[n_down:]],
+                      entry_filters=found["conv"][0].filters)
+
+    src, dst = _layers_by_type(model), _layers_by_type(small)
+
+    def copy_bn(i, channels):
+        dst["bn"][i].set_weights([w[channels] for w in src["bn"][i].get_weights()])
+
+    # bloc d'entrée: inchangé
+    dst["conv"][0].set_weights(src["conv"][0].get_weights())
+    dst["bn"][0].set_weights(src["bn"][0].get_weights())
+    prev = np.arange(src["conv"][0].filters)
+
+    for i, (first, second) in enumerate(kept[:n_down]):
+        depthwise, pointwise, bias = src["separable"][2 * i].get_weights()
+        dst["separable"][2 * i].set_weights(
+            [depthwise[:, :, prev], pointwise[:, :, prev][..., first], bias[first]])
+        copy_bn(1 + 2 * i, first)
+        depthwise, pointwise, bias = src["separable"][2 * i + 1].get_weights()
+        dst["separable"][2 * i + 1].set_weights(
+            [depthwise[:, :, first], pointwise[:, :, first][..., second], bias[second]])
+        copy_bn(2 + 2 * i, second)
+        # projection du résidu: mêmes canaux que la sortie du bloc
+        kernel, bias = src["conv"][1 + i].get_weights()
+        dst["conv"][1 + i].set_weights([kernel[:, :, prev][..., second], bias[second]])
+        prev = second
+
+    for j, (first, second) in enumerate(kept[n_down:]):
+        bn = 1 + 2 * n_down + 2 * j
+        # noyau de Conv2DTranspose: (k, k, sorties, entrées)
+        kernel, bias = src["transpose"][2 * j].get_weights()
+        dst["transpose"][2 * j].set_weights([kernel[:, :, first][..., prev], bias[first]])
+        copy_bn(bn, first)
+        kernel, bias = src["transpose"][2 * j + 1].get_weights()
+        dst["transpose"][2 * j + 1].set_weights([kernel[:, :, second][..., first],
+                                                 bias[second]])
+        copy_bn(bn + 1, second)
+        kernel, bias = src["conv"][1 + n_down + j].get_weights()
+        dst["conv"][1 + n_down + j].set_weights([kernel[:, :, prev][..., second], bias[second]])
+        prev = second
+
+    # couche de classification
+    kernel, bias = src["conv"][-1].get_weights()
+    dst["conv"][-1].set_weights([kernel[:, :, prev], bias])
+    return small
+
+
+def fine_tune(model, epochs=1, steps=None):
+    """court réentrainement du modèle élagué sur le jeu d'entrainement"""
+    input_img_paths, target_img_paths = get_paths()
+    train_indices, val_indices = split_indices()
+    uint8 = model.inputs[0].dtype == "uint8"
+    train_gen = OxfordPets(batch_size, img_size, input_img_paths, target_img_paths,
+                           train_indices, shuffle=True, seed=42, uint8=uint8)
+    val_gen = OxfordPets(batch_size, img_size, input_img_paths, target_img_paths,
+                         val_indices, uint8=uint8)
+    model.compile(optimizer="rmsprop", loss="sparse_categorical_crossentropy")
+    model.fit(train_gen, epochs=epochs, steps_per_epoch=steps, validation_data=val_gen,
+              shuffle=False, verbose=1)
+    return model
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="élagage des filtres du U-Net")
+    parser.add_argument("--model", default="oxford_segmentation.h5")
+    parser.add_argument("--keep", type=float, default=0.5,
+                        help="fraction des filtres gardés dans chaque bloc")
+    parser.add_argument("--epochs", type=int, default=1, help="époques de réentrainement")
+    parser.add_argument("--steps", type=int, default=None, help="batches par époque")
+    args = parser.parse_args()
+
+    model = keras.models.load_model(args.model, compile=False)
+    pruned = fine_tune(prune(model, args.keep), args.epochs, args.steps)
+    output = os.path.splitext(args.model)[0] + "_pruned.h5"
+    pruned.save(output)
+
+    print(f"\n{'':<10} {'paramètres':>12} {'GFLOPs':>8} {'latence (ms)':>13}")
+    for name, m in [("original", model), ("élagué", pruned)]:
+        stats = summary(m)
+        print(f"{name:<10} {stats['params']:>12,} {stats['gflops']:>8.2f} "
+              f"{stats['latency_ms']:>13.1f}")
+    print("modèle élagué:", output)
@@ -0,0 +1,111 @@
+import json
+import os
+import xml.etree.ElementTree as ET
+
+from PIL import Image
+import numpy as np
+
+from config import annotations_dir
+from image_io import clip_box
+
+# boîtes englobantes des têtes (seulement une partie des images en a une)
+xml_dir = os.path.join(annotations_dir, "xmls")
+# index des boîtes: {nom: [xmin, ymin, xmax, ymax, largeur, hauteur]}
+roi_index_path = "roi_index.json"
+
+_roi_index = None
+
+
+def _parse_xml(path):
+    root = ET.parse(path).getroot()
+    box = root.find("object/bndbox")
+    size = root.find("size")
+    return [int(float(box.find(tag).text)) for tag in ("xmin", "ymin", "xmax", "ymax")] + [
+        int(size.find("width").text), int(size.find("height").text)
+    ]
+
+
+def build_roi_index():
+    """
+    fonction qui lit une seule fois toutes les boîtes de annotations/xmls
+    et les enregistre dans roi_index.json
+    """
+    index = {}
+    if os.path.isdir(xml_dir):
+        for fname in sorted(os.listdir(xml_dir)):
+            if fname.endswith(".xml"):
+                index[fname[:-4]] = _parse_xml(os.path.join(xml_dir, fname))
+    with open(roi_index_path, "w") as f:
+        json.dump(index, f)
+    return index
+
+
+def load_roi_index():
+    """
+    charge l'index des boîtes (reconstruit si annotations/xmls a changé)
+    """
+    global _roi_index
+    if _roi_index is None:
+        stale = not os.path.exists(roi_index_path) or (
+            os.path.isdir(xml_dir)
+            and os.path.getmtime(xml_dir) > os.path.getmtime(roi_index_path)
+        )
+        if stale:
+            _roi_index = build_roi_index()
+        else:
+            with open(roi_index_path) as f:
+                _roi_index = json.load(f)
+    return _roi_index
+
+
+def expand_box(box, scale=3.0):
+    """
+    agrandit la boîte de la tête (centrée, `scale` fois sa largeur et sa hauteur)
+    pour couvrir l'animal, limitée aux bords de l'image
+    """
+    x0, y0, x1, y1, width, height = box
+    cx, cy = (x0 + x1) / 2, (y0 + y1) / 2
+    half_w, half_h = scale * (x1 - x0) / 2, scale * (y1 - y0) / 2
+    return [
+        max(0, int(cx - half_w)), max(0, int(cy - half_h)),
+        min(width, int(np.ceil(cx + half_w))), min(height, int(np.ceil(cy + half_h))),
+    ]
+
+
+def roi_boxes(stems, scale=3.0):
+    """
+    boîte de découpe (x0, y0, x1, y1) de chaque image, tableau (N, 4);
+    -1 pour les images sans boîte: l'image entière est utilisée
+    """
+    index = load_roi_index()
+    boxes = np.full((len(stems), 4), -1, dtype="int32")
+    for i, stem in enumerate(stems):
+        if stem in index:
+            boxes[i] = expand_box(index[stem], scale)
+    return boxes
+
+
+def paste_mask(mask, box, size, background=1):
+    """
+    replace un masque prédit sur la zone découpée dans l'image entière
+    (size: largeur, hauteur); hors de la zone: label `background` (fond)
+    """
+    # même zone que celle découpée par image_io.load_input
+    # (la taille réelle de l'image peut différer de celle du fichier xml)
+    box = clip_box(box, size)
+    if box is None:
+        return np.asarray(Image.fromarray(mask).resize(size, Image.NEAREST))
+    x0, y0, x1, y1 = box
+    full = np.full((size[1], size[0]), background, dtype="uint8")
+    full[y0:y1, x0:x1] = np.asarray(Image.fromarray(mask).resize((x1 - x0, y1 - y0),
+                                                                 Image.NEAREST))
+    return full
+
+
+if __name__ == "__main__":
+    from config import get_samples
+
+    samples = get_samples()
+    boxes = roi_boxes([s["stem"] for s in samples])
+    print(f"{(boxes[:, 0] >= 0).sum()} images sur {len(samples)} ont une boîte "
+          f"({roi_index_path})")
@@ -4,18 +4,43 @@ from tensorflow.keras import backend as K
 from config import img_size,num_classes
 
 
-def get_model(img_size, num_classes):
+def get_model(img_size, num_classes, input_dtype="float32", width=1.0, depth=3,
+              block="separable", down_filters=None, up_filters=None, entry_filters=None):
     """
     fonction qui crée le modèle de deep learning 
     (modèle de segmentation UNET)
+    input_dtype="uint8": le modèle reçoit les pixels bruts en uint8,
+    la conversion en float et la normalisation sont faites dans le graphe
+    width: multiplicateur du nombre de filtres de tous les blocs
+    depth: nombre de blocs de downsampling (3 par défaut: 64, 128, 256 filtres)
+    block: "separable" (SeparableConv2D) ou "conv" (Conv2D) pour les blocs descendants
+    down_filters / up_filters / entry_filters: nombre de filtres de chaque bloc,
+    à la place de width et depth (utilisé par exemple par prune.py)
     """
-    inputs = layers.Input(shape=img_size + (3,))
+    if entry_filters is None:
+        entry_filters = max(1, round(32 * width))
+    if down_filters is None:
+        down_filters = [max(1, round(64 * 2 ** i * width)) for i in range(depth)]
+    if up_filters is None:
+        up_filters = list(down_filters[::-1]) + [entry_filters]
+    # chaque bloc descendant divise la taille par 2 (plus le bloc d'entrée)
+    factor = 2 ** len(down_filters) * 2
+    if img_size[0] is not None and (img_size[0] % factor or img_size[1] % factor):
+        raise ValueError(f"img_size {img_size} doit être divisible par {factor} "
+                         f"avec {len(down_filters)} blocs")
+    conv_block = {"separable": layers.SeparableConv2D, "conv": layers.Conv2D}[block]
+
+    inputs = layers.Input(shape=img_size + (3,), dtype=input_dtype)
+    x = inputs
+    if input_dtype == "uint8":
+        # cast + mise à l'échelle [0, 255] -> [0, 1] (première couche du modèle)
+        x = layers.Rescaling(1.0 / 255)(x)
 
     ### première partie: downsampling = réduction de la dimension
     # de  l'image ###
 
     # Entry block/bloc d'entrée
-    x = layers.Conv2D(32, 3, strides=2, padding="same")(inputs)
+    x = layers.Conv2D(entry_filters, 3, strides=2, padding="same")(x)
     x = layers.BatchNormalization()(x)
     x = layers.Activation("relu")(x)
 
@@ -24,13 +49,13 @@ def get_model(img_size, num_classes):
     #on stocke x dans une variable "le résidu"
 
     # Blocks 1, 2, 3 are identical apart from the feature depth.
-    for filters in [64, 128, 256]:
+    for filters in down_filters:
         x = layers.Activation("relu")(x)
-        x = layers.SeparableConv2D(filters, 3, padding="same")(x)
+        x = conv_block(filters, 3, padding="same")(x)
         x = layers.BatchNormalization()(x)
 
         x = layers.Activation("relu")(x)
-        x = layers.SeparableConv2D(filters, 3, padding="same")(x)
+        x = conv_block(filters, 3, padding="same")(x)
         x = layers.BatchNormalization()(x)
 
         x = layers.MaxPooling2D(3, strides=2, padding="same")(x)
@@ -45,7 +70,7 @@ def get_model(img_size, num_classes):
     ### première partie: downsampling = augmentation de la dimension
     # de l'image###
 
-    for filters in [256, 128, 64, 32]:
+    for filters in up_filters:
         x = layers.Activation("relu")(x)
         x = layers.Conv2DTranspose(filters, 3, padding="same")(x)
         x = layers.BatchNormalization()(x)
@@ -64,18 +89,21 @@ def get_model(img_size, num_classes):
 
     # On ajoute une couche de classification 
     # (avec autant de couches qu'il y a de classes qu'il y a)
-    outputs = layers.Conv2D(num_classes, 3, activation="softmax", padding="same")(x)
+    # (softmax toujours en float32, même en précision mixte)
+    outputs = layers.Conv2D(num_classes, 3, activation="softmax", padding="same",
+                            dtype="float32")(x)
 
     # Define the model
     model = Model(inputs, outputs)
     return model
 
 
-# libère la RAM occuppée RAM si le modèle a été défini plusieurs fois
-# (impactant lorsque vous développez dans COLAB ou Jupyter notebook)
-K.clear_session()
+if __name__ == "__main__":
+    # libère la RAM occuppée RAM si le modèle a été défini plusieurs fois
+    # (impactant lorsque vous développez dans COLAB ou Jupyter notebook)
+    K.clear_session()
 
-# Build model
-model = get_model(img_size, num_classes)
-#  afficher la structure du modèle
-print(model.summary())
+    # Build model
+    model = get_model(img_size, num_classes)
+    #  afficher la structure du modèle
+    print(model.summary())
@@ -0,0 +1,79 @@
+import numpy as np
+from tensorflow import keras
+
+from augment import AugmentedSequence
+from callbacks import BackgroundCheckpoint, load_train_state, restore_train_state
+from get_data_info import CachedOxfordPets
+
+
+def _data():
+    rng = np.random.RandomState(0)
+    x = rng.randint(0, 256, (40, 32, 32, 3)).astype("uint8")
+    y = rng.randint(0, 3, (40, 32, 32, 1)).astype("uint8")
+    # même chaîne que train_model.py: ordre des indices et augmentation aléatoires
+    return AugmentedSequence(CachedOxfordPets(8, x, y, shuffle=True, seed=42), seed=42)
+
+
+def _model():
+    model = keras.Sequential([
+        keras.Input((32, 32, 3)),
+        keras.layers.Rescaling(1.0 / 255),
+        keras.layers.Conv2D(3, 3, padding="same", activation="softmax"),
+    ])
+    model.compile(optimizer="rmsprop", loss="sparse_categorical_crossentropy")
+    return model
+
+
+def _fit(model, data, path, initial_epoch, epochs, restore=None):
+    checkpoint = BackgroundCheckpoint(path, data, restore=restore)
+    model.fit(data, initial_epoch=initial_epoch, epochs=epochs, shuffle=False, verbose=0,
+              callbacks=[checkpoint])
+    return load_train_state(path)
+
+
+def _assert_same_data_state(a, b):
+    assert len(a) == len(b)
+    for seq_a, seq_b in zip(a, b):
+        if seq_a["rng"] is None:
+            assert seq_b["rng"] is None
+        else:
+            # ("MT19937", clés, position, has_gauss, cached_gaussian)
+            for value_a, value_b in zip(seq_a["rng"], seq_b["rng"]):
+                assert np.array_equal(value_a, value_b)
+        if seq_a["indices"] is None:
+            assert seq_b["indices"] is None
+        else:
+            assert np.array_equal(seq_a["indices"], seq_b["indices"])
+
+
+def test_resume_restores_data_order(tmp_path):
+    # entrainement de 2 époques sans interruption
+    uninterrupted = _fit(_model(), _data(), str(tmp_path / "a.pkl"), 0, 2)
+
+    # 1 époque, puis reprise à la 2e époque avec de nouveaux objets
+    state = _fit(_model(), _data(), str(tmp_path / "b.pkl"), 0, 1)
+    model = _model()
+    restore_train_state(model, state)
+    data = _data()
+    resumed = _fit(model, data, str(tmp_path / "c.pkl"), state["epoch"] + 1, 2,
+                   restore=state["data"])
+
+    assert resumed["epoch"] == uninterrupted["epoch"] == 1
+    _assert_same_data_state(uninterrupted["data"], resumed["data"])
+
+
+def test_best_model_written_in_background(tmp_path):
+    model, data = _model(), _data()
+    best_path = str(tmp_path / "best.h5")
+    checkpoint = BackgroundCheckpoint(str(tmp_path / "state.pkl"), data, best_path=best_path)
+    model.fit(data, epochs=2, validation_data=_data(), shuffle=False, verbose=0,
+              callbacks=[checkpoint])
+
+    # poids de l'époque à la val_loss minimale
+    state = load_train_state(str(tmp_path / "state.pkl"))
+    best = keras.models.load_model(best_path, compile=False)
+    if state["history"][1] < state["history"][0]:
+        for saved, last in zip(best.get_weights(), state["weights"]):
+            assert np.array_equal(saved, last)
+    else:
+        assert not np.array_equal(best.get_weights()[0], state["weights"][0])
@@ -0,0 +1,27 @@
+import numpy as np
+from tensorflow import keras
+
+from callbacks import StepTimer, TimedSequence
+from get_data_info import CachedOxfordPets
+
+
+def test_instant_loader_has_no_data_wait(tmp_path):
+    # batches en mémoire: aucun décodage, l'entrainement est limité par le calcul
+    rng = np.random.RandomState(0)
+    x = rng.randint(0, 256, (128, 64, 64, 3)).astype("uint8")
+    y = rng.randint(0, 3, (128, 64, 64, 1)).astype("uint8")
+    data = TimedSequence(CachedOxfordPets(8, x, y))
+    model = keras.Sequential([
+        keras.Input((64, 64, 3)),
+        keras.layers.Rescaling(1.0 / 255),
+        keras.layers.Conv2D(32, 3, padding="same", activation="relu"),
+        keras.layers.Conv2D(3, 3, padding="same", activation="softmax"),
+    ])
+    model.compile(optimizer="rmsprop", loss="sparse_categorical_crossentropy")
+    timer = StepTimer(8, str(tmp_path), data=data)
+    model.fit(data, epochs=1, shuffle=False, verbose=0, callbacks=[timer])
+
+    # le premier pas (traçage) est compté à part
+    assert timer.steps == len(data) - 1
+    assert timer.compile_time > 0
+    assert timer.wait_time < 0.05 * (timer.wait_time + timer.compute_time)
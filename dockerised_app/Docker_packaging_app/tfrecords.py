@@ -0,0 +1,149 @@
+import argparse
+import hashlib
+import json
+import os
+
+import tensorflow as tf
+
+from config import tfrecord_dir
+
+
+def _bytes_feature(value):
+    return tf.train.Feature(bytes_list=tf.train.BytesList(value=[value]))
+
+
+def shard_pattern(prefix, out_dir=tfrecord_dir):
+    return os.path.join(out_dir, f"{prefix}-*.tfrecord")
+
+
+def shard_key(input_img_paths, target_img_paths, num_shards):
+    """
+    clé des shards: dépend de la liste des fichiers (index, paires exclues
+    par check_data.py, split) et du nombre de shards
+    """
+    h = hashlib.sha1()
+    h.update(str(num_shards).encode())
+    for input_path, target_path in zip(input_img_paths, target_img_paths):
+        h.update(input_path.encode())
+        h.update(b"|")
+        h.update(target_path.encode())
+        h.update(b"\n")
+    return h.hexdigest()[:16]
+
+
+def _meta_path(prefix, out_dir):
+    return os.path.join(out_dir, prefix + ".json")
+
+
+def has_tfrecords(prefix, out_dir=tfrecord_dir):
+    # le fichier json est écrit après les shards: il indique qu'ils sont complets
+    return os.path.exists(_meta_path(prefix, out_dir))
+
+
+def write_tfrecords(input_img_paths, target_img_paths, prefix, num_shards=16,
+                    out_dir=tfrecord_dir):
+    """
+    fonction qui écrit les paires image/trimap dans num_shards fichiers TFRecord
+    les fichiers sont copiés tels quels (jpg et png): le décodage est fait
+    par le pipeline tf.data
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    writers = [
+        tf.io.TFRecordWriter(
+            os.path.join(out_dir, f"{prefix}-{i:05d}-of-{num_shards:05d}.tfrecord")
+        )
+        for i in range(num_shards)
+    ]
+    for i, (input_path, target_path) in enumerate(zip(input_img_paths, target_img_paths)):
+        with open(input_path, "rb") as f:
+            image = f.read()
+        with open(target_path, "rb") as f:
+            mask = f.read()
+        example = tf.train.Example(features=tf.train.Features(feature={
+            "image": _bytes_feature(image),
+            "mask": _bytes_feature(mask),
+        }))
+        # répartition des exemples sur les shards à tour de rôle
+        writers[i % num_shards].write(example.SerializeToString())
+    for writer in writers:
+        writer.close()
+    with open(_meta_path(prefix, out_dir), "w") as f:
+        json.dump({"num_samples": len(input_img_paths), "num_shards": num_shards}, f)
+
+
+def build_tfrecords(name, input_img_paths, target_img_paths, num_shards=16,
+                    out_dir=tfrecord_dir):
+    """
+    shards d'un split (ex: name="random-train"), écrits seulement s'ils
+    n'existent pas déjà pour cette liste de fichiers
+    renvoie le préfixe des shards ("<name>-<clé>")
+    """
+    prefix = f"{name}-{shard_key(input_img_paths, target_img_paths, num_shards)}"
+    if not has_tfrecords(prefix, out_dir):
+        write_tfrecords(input_img_paths, target_img_paths, prefix, num_shards, out_dir)
+    return prefix
+
+
+def _parse_example(serialized, img_size, uint8=False):
+    features = tf.io.parse_single_example(serialized, {
+        "image": tf.io.FixedLenFeature([], tf.string),
+        "mask": tf.io.FixedLenFeature([], tf.string),
+    })
+    # decode_image: certains fichiers .jpg du jeu de données sont des png
+    image = tf.io.decode_image(features["image"], channels=3, expand_animations=False)
+    image = tf.image.resize(image, img_size, method="nearest")
+    mask = tf.io.decode_png(features["mask"], channels=1)
+    mask = tf.image.resize(mask, img_size, method="nearest")
+    # Ground truth labels are 1, 2, 3. Subtract one to make them 0, 1, 2:
+    if uint8:
+        return image, mask - 1
+    return tf.cast(image, tf.float32), mask - 1
+
+
+def make_dataset(file_pattern, img_size, batch_size, shuffle=True, uint8=False):
+    """
+    pipeline tf.data: lecture entrelacée des shards, décodage en parallèle
+    et préchargement des batches (réglages AUTOTUNE)
+    uint8=True: les images restent en uint8 (normalisées par le modèle)
+    """
+    files = tf.data.Dataset.list_files(file_pattern, shuffle=shuffle)
+    ds = files.interleave(
+        tf.data.TFRecordDataset,
+        cycle_length=tf.data.AUTOTUNE,
+        num_parallel_calls=tf.data.AUTOTUNE,
+        deterministic=not shuffle,
+    )
+    if shuffle:
+        ds = ds.shuffle(1000)
+    ds = ds.map(
+        lambda serialized: _parse_example(serialized, img_size, uint8),
+        num_parallel_calls=tf.data.AUTOTUNE,
+        deterministic=not shuffle,
+    )
+    ds = ds.batch(batch_size, drop_remainder=True)
+    return ds.prefetch(tf.data.AUTOTUNE)
+
+
+def build_split_tfrecords(split="random", num_shards=16, out_dir=tfrecord_dir):
+    """
+    shards "<split>-train" et "<split>-val" lus par train_model.train
+    renvoie (préfixe train, préfixe val)
+    """
+    from config import get_paths
+    from get_data_info import split_indices
+
+    input_img_paths, target_img_paths = get_paths()
+    return tuple(
+        build_tfrecords(f"{split}-{name}", [input_img_paths[k] for k in indices],
+                        [target_img_paths[k] for k in indices], num_shards, out_dir)
+        for name, indices in zip(["train", "val"], split_indices(split))
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--shards", type=int, default=16, help="nombre de fichiers TFRecord")
+    parser.add_argument("--split", choices=["random", "official"], default="random")
+    args = parser.parse_args()
+    prefixes = build_split_tfrecords(args.split, args.shards)
+    print("TFRecords dans", tfrecord_dir, ":", ", ".join(prefixes))
@@ -0,0 +1,239 @@
+import argparse
+import collections
+import os
+import struct
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+import numpy as np
+from tensorflow import keras
+
+from config import img_size, num_classes
+from predict import list_images, palette
+
+
+def blend_window(tile_size):
+    """
+    poids de chaque pixel d'une tuile pour le mélange des recouvrements:
+    maximal au centre, faible sur les bords
+    """
+    ramps = [
+        np.minimum(np.arange(1, n + 1), np.arange(n, 0, -1)).astype("float32")
+        for n in tile_size
+    ]
+    window = np.outer(ramps[0], ramps[1])
+    return window / window.max()
+
+
+def tile_starts(length, tile, stride):
+    """positions de départ des tuiles sur un axe (la dernière touche le bord)"""
+    if length <= tile:
+        return [0]
+    return list(range(0, length - tile, stride)) + [length - tile]
+
+
+def open_image(path, scale=1.0):
+    """
+    image RGB (PIL) éventuellement mise à l'échelle, et taille d'origine;
+    les tuiles sont lues par bandes horizontales (read_strip)
+    """
+    with Image.open(path) as img:
+        size = img.size
+        img = img.convert("RGB")
+    if scale != 1.0:
+        img = img.resize((round(size[0] * scale), round(size[1] * scale)), Image.BILINEAR)
+    return img, size
+
+
+def read_strip(img, y):
+    """
+    bande de img_size[0] lignes à partir de la ligne y, complétée par effet
+    miroir si l'image est plus petite qu'une tuile
+    """
+    w, h = img.size
+    pixels = np.asarray(img.crop((0, y, w, min(y + img_size[0], h))), dtype="uint8")
+    pad_h, pad_w = max(0, img_size[0] - pixels.shape[0]), max(0, img_size[1] - w)
+    if pad_h or pad_w:
+        pixels = np.pad(pixels, ((0, pad_h), (0, pad_w), (0, 0)), mode="reflect")
+    return pixels
+
+
+def _png_chunk(kind, data):
+    return (struct.pack(">I", len(data)) + kind + data
+            + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF))
+
+
+class MaskPngWriter:
+    """
+    png à palette (labels 0, 1, 2) écrit ligne par ligne: seules les lignes
+    reçues sont en mémoire, compressées au fur et à mesure
+    """
+
+    def __init__(self, path, width, height):
+        self.file = open(path, "wb")
+        self.width = width
+        self.compressor = zlib.compressobj()
+        self.file.write(b"\x89PNG\r\n\x1a\n")
+        # 8 bits par pixel, type 3 (palette)
+        self.file.write(_png_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 3, 0, 0, 0)))
+        self.file.write(_png_chunk(b"PLTE", bytes(palette)))
+
+    def write_rows(self, rows):
+        # un octet de filtre (0: aucun) devant chaque ligne
+        data = np.empty((rows.shape[0], self.width + 1), dtype="uint8")
+        data[:, 0] = 0
+        data[:, 1:] = rows
+        compressed = self.compressor.compress(data.tobytes())
+        if compressed:
+            self.file.write(_png_chunk(b"IDAT", compressed))
+
+    def close(self):
+        self.file.write(_png_chunk(b"IDAT", self.compressor.flush()))
+        self.file.write(_png_chunk(b"IEND", b""))
+        self.file.close()
+
+
+def _nearest(dst, src):
+    # indices source du redimensionnement "nearest" de PIL (centres des pixels)
+    return np.minimum(((np.arange(dst) + 0.5) * src / dst).astype(int), src - 1)
+
+
+def predict_tiled(model, input_paths, output_dir, overlap=32, batch_size=64, workers=4,
+                  scale=1.0, max_pending_images=8):
+    """
+    segmentation pleine résolution: chaque image est découpée en tuiles
+    img_size qui se recouvrent de `overlap` pixels; les tuiles de plusieurs
+    images sont prédites ensemble, puis les probabilités sont mélangées
+    (blend_window).
+    Les images sont traitées par bandes horizontales: l'accumulateur ne garde
+    que les img_size[0] lignes encore ouvertes, et les lignes terminées du
+    masque sont écrites aussitôt dans le png (MaskPngWriter).
+    La mémoire est bornée: au plus max_pending_images images décodées ou en
+    cours, chacune avec une bande d'accumulation, et un batch de tuiles;
+    seule l'image décodée (3 octets par pixel) dépend de la taille de l'image
+    (PIL décode les JPEG et png en entier, pas par région).
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    th, tw = img_size
+    window = blend_window(img_size)[..., None]
+    input_dtype = model.inputs[0].dtype
+
+    pool = ThreadPoolExecutor(workers)
+    states = {}
+    batch_tiles, batch_meta = [], []
+    writes = []
+
+    def emit(k, end):
+        # lignes [base, end) terminées: masque écrit, accumulateur décalé
+        state = states[k]
+        base, h, w = state["base"], state["shape"][0], state["shape"][1]
+        n = min(end, h) - base
+        if n > 0:
+            # argmax de la somme pondérée: la normalisation par les poids est inutile
+            mask = np.argmax(state["acc"][:n, :w], axis=-1).astype("uint8")
+            # lignes de l'image d'origine dont la ligne source est terminée
+            rows, cols = state["rows"], state["cols"]
+            first = state["out_row"]
+            last = int(np.searchsorted(rows, base + n))
+            state["out_row"] = last
+            out = mask[rows[first:last] - base][:, cols]
+            # écritures d'une même image dans l'ordre (chaque tâche attend la précédente)
+            previous = state["write"]
+            state["write"] = pool.submit(
+                lambda out=out, previous=previous, writer=state["writer"]:
+                (previous.result() if previous else None, writer.write_rows(out))
+            )
+        shift = max(end - base, 0)
+        state["acc"] = np.concatenate([state["acc"][shift:],
+                                       np.zeros_like(state["acc"][:shift])])
+        state["base"] = end
+        if end >= h:
+            writer, previous = state["writer"], state["write"]
+            writes.append(pool.submit(
+                lambda: (previous.result() if previous else None, writer.close())
+            ))
+            del states[k]
+
+    def flush():
+        probs = model.predict_on_batch(np.stack(batch_tiles).astype(input_dtype))
+        for (k, j, x), p in zip(batch_meta, probs):
+            state = states[k]
+            state["acc"][:, x : x + tw] += p * window
+            state["remaining"][j] -= 1
+            if state["remaining"][j] == 0:
+                # la bande suivante commence à ys[j + 1]: les lignes au-dessus sont finies
+                ys = state["ys"]
+                emit(k, ys[j + 1] if j + 1 < len(ys) else state["shape"][0])
+        batch_tiles.clear()
+        batch_meta.clear()
+
+    with pool:
+        # décodage des images suivantes pendant la prédiction
+        pending = collections.deque()
+        next_image = 0
+        while pending or next_image < len(input_paths):
+            while next_image < len(input_paths) and len(pending) + len(states) < max_pending_images:
+                pending.append((next_image, pool.submit(open_image, input_paths[next_image], scale)))
+                next_image += 1
+            if not pending:
+                # limite atteinte: prédire les tuiles en attente libère des images
+                flush()
+                continue
+            k, future = pending.popleft()
+            img, size = future.result()
+            w, h = img.size
+
+            ys = tile_starts(max(h, th), th, th - overlap)
+            xs = tile_starts(max(w, tw), tw, tw - overlap)
+            name = os.path.splitext(os.path.basename(input_paths[k]))[0] + ".png"
+            states[k] = {
+                # lignes [base, base + th) de l'image mise à l'échelle
+                "acc": np.zeros((th, max(w, tw), num_classes), dtype="float32"),
+                "base": 0,
+                "ys": ys,
+                "remaining": [len(xs)] * len(ys),
+                "shape": (h, w),
+                "rows": _nearest(size[1], h),
+                "cols": _nearest(size[0], w),
+                "out_row": 0,
+                "writer": MaskPngWriter(os.path.join(output_dir, name), *size),
+                "write": None,
+            }
+            for j, y in enumerate(ys):
+                strip = read_strip(img, y)
+                for x in xs:
+                    batch_tiles.append(strip[:, x : x + tw])
+                    batch_meta.append((k, j, x))
+                    if len(batch_tiles) == batch_size:
+                        flush()
+            del img
+        if batch_tiles:
+            flush()
+        for future in writes:
+            future.result()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="segmentation pleine résolution par tuiles qui se recouvrent"
+    )
+    parser.add_argument("input_dir")
+    parser.add_argument("output_dir")
+    parser.add_argument("--model", default="oxford_segmentation.h5")
+    parser.add_argument("--overlap", type=int, default=32, help="recouvrement des tuiles (pixels)")
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="mise à l'échelle des images avant découpage")
+    parser.add_argument("--batch-size", type=int, default=64, help="tuiles par prédiction")
+    parser.add_argument("--workers", type=int, default=4, help="threads de décodage / écriture")
+    args = parser.parse_args()
+
+    model = keras.models.load_model(args.model, compile=False)
+    paths = list_images(args.input_dir)
+    start = time.perf_counter()
+    predict_tiled(model, paths, args.output_dir, args.overlap, args.batch_size, args.workers,
+                  args.scale)
+    duration = time.perf_counter() - start
+    print(f"{len(paths)} images segmentées en {duration:.1f}s "
+          f"({len(paths) / duration:.2f} images/s)")
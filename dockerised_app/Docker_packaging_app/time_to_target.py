@@ -0,0 +1,28 @@
+import json
+import subprocess
+import sys
+
+
+def run(script, args):
+    """
+    un entrainement dans un sous-processus (réglages TensorFlow indépendants):
+    `script --run <checkpoint> ...` affiche en dernière ligne le json renvoyé
+    par train_model.train
+    renvoie [secondes, époque] à la val_loss cible, ou None
+    """
+    out = subprocess.run([sys.executable, script, *args], capture_output=True, text=True)
+    lines = out.stdout.strip().splitlines()
+    if out.returncode != 0 or not lines:
+        print(out.stderr.strip().splitlines()[-1] if out.stderr.strip() else "erreur")
+        return None
+    return json.loads(lines[-1])
+
+
+def print_report(target_loss, results):
+    """tableau du temps pour atteindre la val_loss cible de chaque entrainement"""
+    print(f"\nval_loss cible: {target_loss}")
+    for name, reached in results.items():
+        if reached is None:
+            print(f"{name:<12} cible non atteinte")
+        else:
+            print(f"{name:<12} {reached[0]:8.1f}s (époque {reached[1]})")
@@ -1,69 +1,280 @@
+import argparse
+import os
 import random
 
-from config import batch_size, img_size, num_classes
-from get_data_info import input_img_paths
-from get_data_info import target_img_paths
-from get_data_info import OxfordPets
+from config import batch_size, img_size, num_classes, get_paths, get_samples
+from get_data_info import OxfordPets, CachedOxfordPets, split_indices
 from seg_model import get_model
+from data_cache import build_cache, open_cache
+from prefetch_loader import PrefetchLoader
+from augment import AugmentedSequence
+from cpu_profile import configure_cpu
+from callbacks import (BackgroundCheckpoint, StepTimer, TimedSequence, TimeToTarget,
+                       load_train_state, restore_train_state)
+from hard_examples import HardExampleSampler, per_sample_loss
+from roi import roi_boxes
+from tfrecords import build_split_tfrecords, make_dataset, shard_pattern
 
-from tensorflow.keras.callbacks import ModelCheckpoint, TensorBoard, EarlyStopping
-import matplotlib.pyplot as plt
+from tensorflow.keras.callbacks import TensorBoard, EarlyStopping
+from tensorflow.keras.models import load_model
 import numpy as np
 
-def train():
+def train(use_cache=False, workers=0, prefetch=8, use_processes=False,
+          use_tfrecords=False, num_shards=16, split="random", uint8=False,
+          decode="full", augment=False, intra_op_threads=None, inter_op_threads=None,
+          jit_compile=False, mixed_precision=False, schedule=None, target_loss=None,
+          checkpoint="oxford_segmentation.h5", epochs=10, resume=False, roi_scale=None,
+          hard_examples=None):
+    """
+    epochs: nombre d'époques sans schedule
+    schedule: liste de (taille d'image, nombre d'époques), ex: [((96, 96), 3),
+    ((128, 128), 3), ((160, 160), 4)]; le modèle (entièrement convolutif) garde
+    ses poids et l'état de l'optimiseur d'une étape à l'autre, la validation
+    est toujours faite à img_size (val_loss comparables entre les étapes)
+    target_loss: mesure le temps pour atteindre cette val_loss (callbacks.TimeToTarget)
+    resume: reprend à l'époque suivant le dernier état complet enregistré
+    (<checkpoint>_state.pkl: poids, optimiseur, époque, ordre des données)
+    roi_scale: mode ROI, chaque image est découpée autour de la boîte de la tête
+    (annotations/xmls) agrandie roi_scale fois (voir roi.py)
+    hard_examples: les images de chaque époque sont tirées selon leur dernière
+    loss, cette fraction de l'époque restant uniforme (voir hard_examples.py)
+    renvoie (secondes, époque) à la val_loss cible, ou None
+    """
+    if roi_scale and use_tfrecords:
+        raise ValueError("le mode ROI n'est pas disponible avec --tfrecords")
+    if augment and use_tfrecords:
+        # augment_batch travaille sur les batches numpy des séquences
+        raise ValueError("l'augmentation (--augment) n'est pas disponible avec --tfrecords")
+    if hard_examples is not None and use_tfrecords:
+        raise ValueError("le tirage des exemples difficiles n'est pas disponible avec --tfrecords")
+
+    # réglages CPU (avant la création du modèle)
+    configure_cpu(intra_op_threads, inter_op_threads, mixed_precision)
 
     print("Etape 1: les données sont randomisées:\n")
-    # Split our img paths into a training and a validation set
-    val_samples = 1000
-    rng = np.random.RandomState(42)
-    rng.shuffle(input_img_paths)
-    rng.shuffle(target_img_paths)
-
-    train_input_img_paths = input_img_paths[:-val_samples]
-    train_target_img_paths = target_img_paths[:-val_samples]
-    val_input_img_paths = input_img_paths[-val_samples:]
-    val_target_img_paths = target_img_paths[-val_samples:]
-    
+    # les listes de chemins ne sont ni copiées ni mélangées: chaque split
+    # est un tableau d'indices dans ces listes (image et trimap restent alignés)
+    input_img_paths, target_img_paths = get_paths()
+    train_indices, val_indices = split_indices(split)
+    boxes = None
+    if roi_scale:
+        boxes = roi_boxes([s["stem"] for s in get_samples()], roi_scale)
+        print(f"mode ROI: {(boxes[:, 0] >= 0).sum()} images découpées sur {len(boxes)}")
+
     print("Etape 2: les jeux de données sont préparés:\n")
-    # Instantiate data Sequences for each split
-    train_gen = OxfordPets(
-        batch_size, img_size, train_input_img_paths, train_target_img_paths
-    )
-    val_gen = OxfordPets(batch_size, img_size, val_input_img_paths, val_target_img_paths)
+    if use_tfrecords:
+        # pipeline tf.data: les shards sont écrits au premier lancement
+        # (et réécrits si la liste des fichiers ou le nombre de shards change)
+        train_prefix, val_prefix = build_split_tfrecords(split, num_shards)
 
+    def make_loader(size, training, seed=42):
+        # Instantiate data Sequences for each split
+        # les indices d'entrainement sont re-mélangés à chaque fin d'époque
+        if use_tfrecords:
+            prefix = train_prefix if training else val_prefix
+            return make_dataset(shard_pattern(prefix), size, batch_size, shuffle=training,
+                                uint8=uint8)
+        indices = train_indices if training else val_indices
+        # batches uint8: il faut plus de buffers que de batches préparés en avance
+        buffers = dict(uint8=uint8, num_buffers=(prefetch if workers else 0) + 4)
+        if use_cache:
+            # les images sont décodées une seule fois puis lues dans le cache
+            # (un cache par taille d'image)
+            x, y = open_cache(build_cache(size, input_img_paths, target_img_paths,
+                                          boxes=boxes))
+            gen = CachedOxfordPets(batch_size, x, y, indices, shuffle=training, seed=seed,
+                                   **buffers)
+        else:
+            gen = OxfordPets(batch_size, size, input_img_paths, target_img_paths, indices,
+                             shuffle=training, seed=seed, decode=decode, boxes=boxes,
+                             **buffers)
+        if workers:
+            # les batches sont décodés en parallèle pendant que le modèle s'entraine
+            gen = PrefetchLoader(gen, workers, prefetch, use_processes)
+        if augment and training:
+            # augmentation vectorisée du batch entier, mesurée sur le thread d'entrainement
+            gen = AugmentedSequence(gen, seed=seed)
+        if training:
+            # instant où chaque batch est prêt (attente des données, voir StepTimer)
+            gen = TimedSequence(gen)
+        return gen
+
+    stages = schedule or [(img_size, epochs)]
+    val_gen = make_loader(img_size, training=False)
 
     print("etape 3: le modèle est instantié:\n")
-    net = get_model(img_size, num_classes)
+    input_dtype = "uint8" if uint8 else "float32"
+    # plusieurs tailles: entrée de taille libre (H et W à None)
+    net = get_model((None, None) if schedule else img_size, num_classes,
+                    input_dtype=input_dtype)
 
     # Configurer le modèle pour l'entrainement
     # classification pixel par pixel
+    loss = "sparse_categorical_crossentropy"
+    if hard_examples is not None:
+        # même loss, la loss de chaque image du batch est gardée pour le tirage
+        loss, last_losses = per_sample_loss(batch_size)
     net.compile(optimizer="rmsprop", 
-    loss="sparse_categorical_crossentropy")
+    loss=loss,
+    jit_compile=jit_compile)
+
+    # reprise: état complet de la dernière époque terminée
+    state_path = os.path.splitext(checkpoint)[0] + "_state.pkl"
+    state = None
+    first_epoch = 0
+    if resume and os.path.exists(state_path):
+        state = load_train_state(state_path)
+        restore_train_state(net, state)
+        np.random.set_state(state["numpy_rng"])
+        first_epoch = state["epoch"] + 1
+        print(f"reprise à l'époque {first_epoch + 1} ({state_path})")
+    elif resume:
+        print(f"{state_path} introuvable: entrainement depuis le début")
 
     # définition des callbacks
-    # sauvegarde du modèle
+    time_to_target = TimeToTarget(target_loss)
+    # sauvegarde du meilleur modèle et de l'état complet pour --resume,
+    # écrits en arrière-plan (val_loss des époques avant l'interruption dans history)
+    history = state["history"] if state else []
+    state_checkpoint = BackgroundCheckpoint(state_path, history=history, best_path=checkpoint)
+    step_timer = StepTimer(batch_size, log_dir='/logs')
     callbacks = [
-        ModelCheckpoint("oxford_segmentation.h5", 
-        save_best_only=True),
+        state_checkpoint,
         TensorBoard(log_dir='/logs'),
-        EarlyStopping(monitor="val_loss", min_delta = 1e-1)
+        # temps d'attente des données / temps de calcul de chaque pas
+        step_timer,
+        EarlyStopping(monitor="val_loss", min_delta = 1e-1),
+        time_to_target,
     ]
+    if hard_examples is not None:
+        sampler = HardExampleSampler(last_losses, train_indices, len(input_img_paths),
+                                     hard_examples)
+        # avant state_checkpoint: l'état enregistré contient les indices tirés
+        callbacks.insert(0, sampler)
+        state_checkpoint.extra["hard_examples"] = sampler
+        if state is not None and "hard_examples" in state.get("extra", {}):
+            # losses mesurées avant l'interruption
+            sampler.set_state(state["extra"]["hard_examples"])
 
     # Entrainement du modèle
     # Avec validation à la fin de chaque époch.
     # on met le paramètre de niveau de détails au maximum 
     # (barre de progrès)
     # avec verbose=1
-    epochs = 10
-    history = net.fit(train_gen, 
-                        epochs=epochs, 
-                        validation_data=val_gen, 
-                        callbacks=callbacks, verbose=1)
-    plt.plot(history.history["val_loss"])
+    # première époque de chaque étape
+    epoch = 0
+    for stage, (size, stage_epochs) in enumerate(stages):
+        end = epoch + stage_epochs
+        if end <= first_epoch:
+            # étape terminée avant l'interruption
+            epoch = end
+            continue
+        if schedule:
+            print(f"étape {stage + 1}/{len(stages)}: images {size[0]}x{size[1]}, "
+                  f"{stage_epochs} époques")
+        train_gen = make_loader(size, training=True, seed=42 + stage)
+        state_checkpoint.data, state_checkpoint.stage = train_gen, stage
+        if state is not None and state["stage"] == stage:
+            # même ordre des données que sans interruption
+            # (remis par state_checkpoint au début de fit)
+            state_checkpoint.restore = state["data"]
+        # pipeline tf.data: pas de TimedSequence, l'attente n'est pas mesurée
+        step_timer.data = None if use_tfrecords else train_gen
+        if hard_examples is not None:
+            sampler.data = train_gen
+        net.fit(train_gen, 
+                initial_epoch=max(epoch, first_epoch),
+                epochs=end, 
+                validation_data=val_gen, 
+                callbacks=callbacks, verbose=1,
+                # l'ordre est mélangé par la séquence (on_epoch_end)
+                shuffle=False)
+        epoch = end
+        if net.stop_training:
+            # EarlyStopping: les étapes suivantes ne sont pas lancées
+            break
+    print(f"modèle et états enregistrés en arrière-plan: "
+          f"{state_checkpoint.write_time:.1f}s d'écriture")
+
+    if schedule:
+        # le meilleur modèle est ré-enregistré avec l'entrée fixe img_size
+        # (attendue par predict.py, model_stats.py, export_tflite.py...)
+        best = load_model(checkpoint, compile=False)
+        fixed = get_model(img_size, num_classes, input_dtype=input_dtype)
+        fixed.set_weights(best.get_weights())
+        fixed.save(checkpoint)
+
+    # import ici: matplotlib n'est chargé qu'à la fin de l'entrainement
+    import matplotlib.pyplot as plt
+
+    plt.plot(state_checkpoint.history)
     
     plt.savefig("Loss training.jpg", dpi=100)
     plt.show()
+    return time_to_target.reached
+
+
+def _parse_schedule(value):
+    # "96:3,128:3,160:4" -> [((96, 96), 3), ((128, 128), 3), ((160, 160), 4)]
+    stages = []
+    for stage in value.split(","):
+        size, epochs = stage.split(":")
+        stages.append(((int(size), int(size)), int(epochs)))
+    return stages
+
 
 if __name__ == "__main__":
-    train()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cache", action="store_true",
+                        help="utiliser le cache des images prétraitées (data_cache.py)")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="nombre de workers qui préparent les batches (0: aucun)")
+    parser.add_argument("--prefetch", type=int, default=8,
+                        help="nombre de batches préparés en avance")
+    parser.add_argument("--processes", action="store_true",
+                        help="utiliser des processus au lieu de threads")
+    parser.add_argument("--tfrecords", action="store_true",
+                        help="utiliser le pipeline tf.data sur des shards TFRecord")
+    parser.add_argument("--shards", type=int, default=16,
+                        help="nombre de shards TFRecord à écrire")
+    parser.add_argument("--split", choices=["random", "official"], default="random",
+                        help="split aléatoire (1000 images de validation) ou splits officiels")
+    parser.add_argument("--uint8", action="store_true",
+                        help="batches uint8, normalisation faite par le modèle")
+    parser.add_argument("--decode", choices=["full", "draft"], default="full",
+                        help="décodage JPEG complet ou à résolution réduite (draft)")
+    parser.add_argument("--augment", action="store_true",
+                        help="augmentation des batches (crop, flip, luminosité)")
+    parser.add_argument("--intra-threads", type=int, default=None,
+                        help="threads par opération TensorFlow (voir cpu_profile.py)")
+    parser.add_argument("--inter-threads", type=int, default=None,
+                        help="opérations TensorFlow exécutées en parallèle")
+    parser.add_argument("--jit", action="store_true", help="compilation XLA (jit_compile)")
+    parser.add_argument("--bf16", action="store_true", help="précision mixte bfloat16")
+    parser.add_argument("--schedule", type=_parse_schedule, default=None,
+                        help="tailles d'images progressives, ex: 96:3,128:3,160:4 "
+                             "(taille:époques)")
+    parser.add_argument("--target-loss", type=float, default=None,
+                        help="afficher le temps pour atteindre cette val_loss")
+    parser.add_argument("--checkpoint", default="oxford_segmentation.h5")
+    parser.add_argument("--epochs", type=int, default=10, help="époques (sans --schedule)")
+    parser.add_argument("--resume", action="store_true",
+                        help="reprendre après la dernière époque terminée")
+    parser.add_argument("--roi", type=float, default=None, metavar="SCALE",
+                        help="mode ROI: découpe autour de la boîte de la tête agrandie "
+                             "SCALE fois (ex: 3)")
+    parser.add_argument("--hard-examples", type=float, default=None, metavar="FLOOR",
+                        help="tirer les images selon leur dernière loss, FLOOR: fraction "
+                             "de l'époque tirée uniformément (ex: 0.2)")
+    args = parser.parse_args()
+    train(use_cache=args.cache, workers=args.workers, prefetch=args.prefetch,
+          use_processes=args.processes, use_tfrecords=args.tfrecords,
+          num_shards=args.shards, split=args.split,
+          uint8=args.uint8, decode=args.decode,
+          augment=args.augment, intra_op_threads=args.intra_threads,
+          inter_op_threads=args.inter_threads, jit_compile=args.jit,
+          mixed_precision=args.bf16, schedule=args.schedule,
+          target_loss=args.target_loss, checkpoint=args.checkpoint,
+          epochs=args.epochs, resume=args.resume, roi_scale=args.roi,
+          hard_examples=args.hard_examples)
 
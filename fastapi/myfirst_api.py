@@ -1,9 +1,36 @@
+import asyncio
+import contextlib
+import os
+
 import uvicorn
-from fastapi import FastAPI
-from python_code import train_model, predict_model
+from fastapi import FastAPI, File, HTTPException, UploadFile
+from fastapi.responses import Response
+from python_code import train_model, predict_model, segment_model
+
+# modèle de segmentation chargé une seule fois, au démarrage
+SEGMENT_MODEL = os.environ.get("SEGMENT_MODEL", "oxford_segmentation.h5")
+SEGMENT_BATCH_SIZE = int(os.environ.get("SEGMENT_BATCH_SIZE", 32))
+SEGMENT_MAX_WAIT_MS = float(os.environ.get("SEGMENT_MAX_WAIT_MS", 10))
+segmenter = None
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    # démarrage: chargement du modèle et du batcher; arrêt: fin du batcher
+    global segmenter
+    if os.path.exists(SEGMENT_MODEL):
+        segmenter = segment_model.SegmentBatcher(SEGMENT_MODEL, SEGMENT_BATCH_SIZE,
+                                                 SEGMENT_MAX_WAIT_MS)
+        segmenter.start()
+    else:
+        print(f"{SEGMENT_MODEL} introuvable: /segment désactivé")
+    yield
+    if segmenter is not None:
+        await segmenter.stop()
+
 
 # initialisation
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # route
 @app.get('/')
@@ -30,5 +57,22 @@ async def predict(features):
     # retour du resultat
     return {"predicted_class": str([classes[re] for re in res])}
 
+@app.post('/segment')
+async def segment(file: UploadFile = File(...)):
+    # masque png (animal, fond, contour) à la taille de l'image envoyée
+    if segmenter is None:
+        raise HTTPException(status_code=503, detail="modèle de segmentation non chargé")
+    content = await file.read()
+    loop = asyncio.get_running_loop()
+    # décodage / encodage hors de la boucle: les autres requêtes continuent d'arriver
+    try:
+        pixels, size = await loop.run_in_executor(None, segment_model.decode, content,
+                                                   segmenter.img_size)
+    except OSError:
+        raise HTTPException(status_code=400, detail="image illisible")
+    mask = await segmenter.predict(pixels)
+    png = await loop.run_in_executor(None, segment_model.encode_mask, mask, size)
+    return Response(content=png, media_type="image/png")
+
 if __name__ =='__main__':
     uvicorn.run(app, host="127.0.0.1", port=8000)
\ No newline at end of file
@@ -0,0 +1,144 @@
+import asyncio
+import io
+import os
+import time
+
+import numpy as np
+from PIL import Image
+
+# couleurs des masques png: animal, fond, contour
+palette = [255, 255, 255, 0, 0, 0, 128, 128, 128]
+
+
+def decode(content, img_size):
+    """octets d'une image -> pixels uint8 (img_size: entrée du modèle) et taille d'origine"""
+    with Image.open(io.BytesIO(content)) as img:
+        size = img.size
+        img = img.convert("RGB").resize((img_size[1], img_size[0]), Image.NEAREST)
+        return np.asarray(img, dtype="uint8"), size
+
+
+def encode_mask(mask, size):
+    """masque (labels 0, 1, 2) -> png à palette, à la taille de l'image d'origine"""
+    img = Image.fromarray(mask.astype("uint8"))
+    img.putpalette(palette)
+    img = img.resize(size, Image.NEAREST)
+    buffer = io.BytesIO()
+    img.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class SegmentBatcher:
+    """
+    regroupe les requêtes concurrentes en un seul appel predict:
+    un batch part dès qu'il contient max_batch_size images ou que la
+    première image attend depuis max_wait_ms
+    """
+
+    def __init__(self, model_path, max_batch_size=32, max_wait_ms=10):
+        # import ici: TensorFlow n'est chargé que si le modèle est servi
+        from tensorflow import keras
+
+        self.model = keras.models.load_model(model_path, compile=False)
+        self.input_dtype = self.model.inputs[0].dtype
+        # taille d'entrée du modèle enregistré (decode redimensionne les images à cette taille)
+        self.img_size = tuple(self.model.inputs[0].shape[1:3])
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.queue = None
+        self.worker = None
+        self.batch_sizes = []
+        self.warm_up()
+
+    def warm_up(self):
+        # construction du graphe (batch de 1 puis batch plein, TF passe alors
+        # à une taille de batch variable), pour que la première requête
+        # ne paie pas la compilation
+        for n in sorted({1, self.max_batch_size}):
+            self.model.predict_on_batch(
+                np.zeros((n,) + self.img_size + (3,), dtype=self.input_dtype))
+
+    def start(self):
+        self.queue = asyncio.Queue()
+        self.worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        self.worker.cancel()
+        try:
+            await self.worker
+        except asyncio.CancelledError:
+            pass
+
+    async def predict(self, pixels):
+        """masque (labels 0, 1, 2) d'une image self.img_size (voir decode)"""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((pixels, future))
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            # prédiction dans un thread: la boucle continue de recevoir les requêtes
+            x = np.stack([pixels for pixels, _ in batch]).astype(self.input_dtype)
+            try:
+                probs = await loop.run_in_executor(None, self.model.predict_on_batch, x)
+            except Exception as error:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+            self.batch_sizes.append(len(batch))
+            masks = np.argmax(probs, axis=-1).astype("uint8")
+            for (_, future), mask in zip(batch, masks):
+                # la requête a pu être annulée (client déconnecté)
+                if not future.done():
+                    future.set_result(mask)
+
+
+async def _load_test(batcher, clients, requests_per_client):
+    x = np.random.randint(0, 256, batcher.img_size + (3,), dtype="uint8")
+
+    async def client():
+        for _ in range(requests_per_client):
+            await batcher.predict(x)
+
+    batcher.start()
+    start = time.perf_counter()
+    await asyncio.gather(*[client() for _ in range(clients)])
+    duration = time.perf_counter() - start
+    await batcher.stop()
+    return clients * requests_per_client / duration
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="débit (images/s) du batching dynamique selon le nombre de clients"
+    )
+    parser.add_argument("--model", default=os.environ.get("SEGMENT_MODEL",
+                                                           "oxford_segmentation.h5"))
+    parser.add_argument("--clients", default="1,8,32,64", help="clients concurrents à tester")
+    parser.add_argument("--batch-sizes", default="1,8,32", help="max_batch_size à tester")
+    parser.add_argument("--requests", type=int, default=8, help="requêtes par client")
+    parser.add_argument("--max-wait-ms", type=float, default=10)
+    args = parser.parse_args()
+
+    print("clients | max batch | images/s | batch moyen")
+    for max_batch_size in [int(v) for v in args.batch_sizes.split(",")]:
+        batcher = SegmentBatcher(args.model, max_batch_size, args.max_wait_ms)
+        for clients in [int(v) for v in args.clients.split(",")]:
+            batcher.batch_sizes = []
+            rate = asyncio.run(_load_test(batcher, clients, args.requests))
+            print(f"{clients:7} | {max_batch_size:9} | {rate:8.1f} | "
+                  f"{np.mean(batcher.batch_sizes):11.1f}")